@@ -0,0 +1,87 @@
+# benchmarks/bench_post_list.py
+# 5000件の投稿を含む /posts/ ページを、レスポンス処理パイプライン毎に計測する。
+# DATABASE_URL 未指定時はメモリ上の SQLite にテーブルを作成して投稿を投入する。
+#
+# 使い方: python benchmarks/bench_post_list.py [投稿数]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key')
+os.environ.setdefault('DATABASE_URL', 'sqlite://:memory:')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import RequestFactory
+
+from config.middleware import CompressionMiddleware, HtmlMinifyMiddleware
+from posts.models import Post, author_snapshot
+from posts.views import post_list
+from users.models import CustomUser
+
+LEVELS = ['blue_id', 'speaker', 'manager', 'moderator', 'summit']
+
+
+def populate(count):
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    authors = CustomUser.objects.bulk_create([
+        CustomUser(username=f'user{i}', display_hash=f'{i:07x}', permission_level=LEVELS[i % len(LEVELS)])
+        for i in range(50)
+    ])
+    Post.objects.bulk_create([
+        Post(
+            author=authors[i % len(authors)],
+            title=f'タイトル {i}' if i % 3 else None,
+            content=f'投稿 {i} の内容です。\n' * (1 + i % 4),
+            **author_snapshot(authors[i % len(authors)]), # bulk_create は save() を通らない
+        )
+        for i in range(count)
+    ], batch_size=1000)
+
+
+def run(name, handler, accept_encoding, repeat=5):
+    factory = RequestFactory()
+    best_ttfb = best_total = None
+    size = 0
+    for _ in range(repeat):
+        request = factory.get('/posts/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        request.user = CustomUser(username='bench', permission_level='manager')
+        request._messages = []
+        start = time.perf_counter()
+        response = handler(request)
+        if response.streaming:
+            chunks = iter(response.streaming_content)
+            first = next(chunks, b'')
+            ttfb = time.perf_counter() - start
+            size = len(first) + sum(len(chunk) for chunk in chunks)
+        else:
+            ttfb = time.perf_counter() - start
+            size = len(response.content)
+        total = time.perf_counter() - start
+        best_ttfb = ttfb if best_ttfb is None else min(best_ttfb, ttfb)
+        best_total = total if best_total is None else min(best_total, total)
+    encoding = response.get('Content-Encoding', '-')
+    print(f'{name:<28} {encoding:<6} {size:>12,d} B  TTFB {best_ttfb * 1000:8.1f} ms  total {best_total * 1000:8.1f} ms')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    populate(count)
+    print(f'投稿数: {count}')
+
+    for streaming in (False, True):
+        settings.POST_LIST_STREAMING = streaming
+        mode = 'stream' if streaming else 'render'
+        run(f'{mode}: そのまま', post_list, '')
+        run(f'{mode}: 最小化のみ', HtmlMinifyMiddleware(post_list), '')
+        run(f'{mode}: 最小化 + gzip', CompressionMiddleware(HtmlMinifyMiddleware(post_list)), 'gzip')
+        run(f'{mode}: 最小化 + brotli', CompressionMiddleware(HtmlMinifyMiddleware(post_list)), 'br, gzip')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# commands/admin.py
+from django.contrib import admin
+from .models import CommandLog, CommandLogSummary
+
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    # 監査ログは追記のみ。管理画面からの追加・変更・削除はできない。
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CommandLog)
+class CommandLogAdmin(ReadOnlyAdmin):
+    list_display = ('executed_at', 'actor_username', 'command', 'arguments', 'affected_rows', 'duration_ms', 'error')
+    list_filter = ('command',)
+    date_hierarchy = 'executed_at' # 期間での絞り込み (executed_at のインデックスを使う)
+    search_fields = ('actor_username',)
+    search_help_text = '実行者名 (完全一致)'
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # icontains の全件走査を避け、(actor_username, executed_at) インデックスで引けるよう完全一致で検索する
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(actor_username=search_term), False
+
+
+@admin.register(CommandLogSummary)
+class CommandLogSummaryAdmin(ReadOnlyAdmin):
+    list_display = ('date', 'actor_username', 'command', 'executions', 'affected_rows', 'total_duration_ms')
+    list_filter = ('command',)
+    date_hierarchy = 'date'
+    search_fields = ('actor_username',)
+    search_help_text = '実行者名 (完全一致)'
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(actor_username=search_term), False
@@ -0,0 +1,82 @@
+# commands/audit.py
+# コマンド監査ログのバッファ付き書き込み。
+# process_command 毎に INSERT せず、ワーカー内のバッファに溜めて bulk_create でまとめて書き込む。
+# ワーカーが異常終了した場合、未書き込みのログ (最大 AUDIT_LOG_BATCH_SIZE 件) は失われる。
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import CommandLog
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_lock = threading.Lock()
+_flusher_pid = None # 定期書き込みスレッドを起動したプロセス (fork 後のワーカーでは起動し直す)
+_COMMAND_MAX_LENGTH = CommandLog._meta.get_field('command').max_length
+
+
+def record(actor, command, arguments, affected_rows, duration_ms, error=''):
+    """コマンド実行を1件バッファに追加し、AUDIT_LOG_BATCH_SIZE 件溜まったらまとめて書き込む"""
+    entry = CommandLog(
+        actor=actor,
+        actor_username=actor.username,
+        command=command[:_COMMAND_MAX_LENGTH], # 不明なコマンドは任意の長さになり得る
+        arguments=arguments,
+        affected_rows=affected_rows,
+        duration_ms=duration_ms,
+        error=error,
+        executed_at=timezone.now(),
+    )
+    with _lock:
+        _buffer.append(entry)
+        due = len(_buffer) >= settings.AUDIT_LOG_BATCH_SIZE
+    if due:
+        flush()
+    else:
+        _ensure_flusher()
+
+
+def _ensure_flusher():
+    global _flusher_pid
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name='command-audit-flusher', daemon=True).start()
+
+
+def _flush_periodically():
+    # 件数に達しなくても AUDIT_LOG_FLUSH_INTERVAL 秒毎に書き込む。リクエストの処理中には書き込まない
+    while True:
+        time.sleep(settings.AUDIT_LOG_FLUSH_INTERVAL)
+        if not _buffer:
+            continue
+        flush()
+        # このスレッドの接続を次の書き込みまで開いたままにしない
+        connections.close_all()
+
+
+def flush():
+    """バッファの内容を書き込む。書き込みに失敗してもコマンド処理には影響させない。"""
+    with _lock:
+        entries = _buffer[:]
+        _buffer.clear()
+    if not entries:
+        return 0
+    try:
+        CommandLog.objects.bulk_create(entries, batch_size=settings.AUDIT_LOG_BATCH_SIZE)
+    except Exception:
+        logger.exception("コマンド監査ログの書き込みに失敗しました (%d件)", len(entries))
+        return 0
+    return len(entries)
+
+
+# ワーカー終了時に残りを書き込む
+atexit.register(flush)
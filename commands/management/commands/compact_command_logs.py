@@ -0,0 +1,81 @@
+# commands/management/commands/compact_command_logs.py
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from commands.models import CommandLog, CommandLogSummary
+
+
+class Command(BaseCommand):
+    help = '古いコマンド監査ログを日毎の集計に圧縮し、保存期間を過ぎた集計を削除します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--compact-after-days', type=int, default=settings.AUDIT_LOG_COMPACT_AFTER_DAYS,
+            help='この日数より前の CommandLog を集計に圧縮する',
+        )
+        parser.add_argument(
+            '--retention-days', type=int, default=settings.AUDIT_LOG_RETENTION_DAYS,
+            help='この日数より前の集計を削除する',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        # 日の途中で区切ると同じ日の集計が分割されるため、日付の境界で区切る
+        compact_before = timezone.make_aware(
+            datetime.combine(today - timedelta(days=options['compact_after_days']), time.min)
+        )
+        expire_before = today - timedelta(days=options['retention_days'])
+
+        with transaction.atomic():
+            old_logs = CommandLog.objects.filter(executed_at__lt=compact_before)
+            groups = (
+                old_logs
+                .annotate(date=TruncDate('executed_at'))
+                .values('date', 'actor_username', 'command')
+                .annotate(
+                    executions=Count('id'),
+                    total_affected_rows=Sum('affected_rows'),
+                    total_duration_ms=Sum('duration_ms'),
+                )
+                .order_by()
+            )
+            existing = set(
+                CommandLogSummary.objects
+                .filter(date__lt=compact_before.date())
+                .values_list('date', 'actor_username', 'command')
+            )
+            new_summaries = []
+            for group in groups.iterator():
+                key = (group['date'], group['actor_username'], group['command'])
+                if key in existing:
+                    # 前回の実行後に書き込まれたログがあれば既存の集計に加算する
+                    CommandLogSummary.objects.filter(
+                        date=key[0], actor_username=key[1], command=key[2],
+                    ).update(
+                        executions=F('executions') + group['executions'],
+                        affected_rows=F('affected_rows') + group['total_affected_rows'],
+                        total_duration_ms=F('total_duration_ms') + group['total_duration_ms'],
+                    )
+                    continue
+                new_summaries.append(CommandLogSummary(
+                    date=group['date'],
+                    actor_username=group['actor_username'],
+                    command=group['command'],
+                    executions=group['executions'],
+                    affected_rows=group['total_affected_rows'],
+                    total_duration_ms=group['total_duration_ms'],
+                ))
+            CommandLogSummary.objects.bulk_create(new_summaries, batch_size=1000)
+            compacted, _ = old_logs.delete()
+
+            expired, _ = CommandLogSummary.objects.filter(date__lt=expire_before).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{compacted}件のログを{len(new_summaries)}件の集計に圧縮し、{expired}件の古い集計を削除しました。"
+        ))
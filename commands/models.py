@@ -1 +1,58 @@
+# commands/models.py
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
 
+
+class CommandLog(models.Model):
+    """process_command で実行されたコマンドの監査ログ (追記のみ)"""
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL, # ユーザーが削除されてもログは残す
+        null=True,
+        related_name='command_logs',
+        verbose_name='実行者',
+    )
+    actor_username = models.CharField(max_length=150, verbose_name='実行者名') # 削除後も追えるように保持
+    command = models.CharField(max_length=20, verbose_name='コマンド')
+    arguments = models.TextField(blank=True, verbose_name='引数')
+    affected_rows = models.PositiveIntegerField(default=0, verbose_name='影響行数')
+    duration_ms = models.FloatField(verbose_name='実行時間 (ms)')
+    error = models.TextField(blank=True, verbose_name='エラー')
+    executed_at = models.DateTimeField(default=timezone.now, verbose_name='実行日時')
+
+    def __str__(self):
+        return f"/{self.command} {self.arguments} by {self.actor_username}"
+
+    class Meta:
+        ordering = ['-executed_at']
+        verbose_name = 'コマンド実行ログ'
+        verbose_name_plural = 'コマンド実行ログ'
+        indexes = [
+            models.Index(fields=['executed_at'], name='commandlog_executed_at_idx'),
+            models.Index(fields=['actor_username', 'executed_at'], name='commandlog_actor_idx'),
+        ]
+
+
+class CommandLogSummary(models.Model):
+    """保存期間を過ぎた CommandLog を日・実行者・コマンド毎に集計したもの (compact_command_logs)"""
+    date = models.DateField(verbose_name='日付')
+    actor_username = models.CharField(max_length=150, verbose_name='実行者名')
+    command = models.CharField(max_length=20, verbose_name='コマンド')
+    executions = models.PositiveIntegerField(verbose_name='実行回数')
+    affected_rows = models.PositiveBigIntegerField(verbose_name='影響行数合計')
+    total_duration_ms = models.FloatField(verbose_name='実行時間合計 (ms)')
+
+    def __str__(self):
+        return f"{self.date} /{self.command} x{self.executions} by {self.actor_username}"
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name = 'コマンド実行集計'
+        verbose_name_plural = 'コマンド実行集計'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'actor_username', 'command'], name='commandlogsummary_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['actor_username', 'date'], name='commandlogsummary_actor_idx'),
+        ]
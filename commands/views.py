@@ -1,14 +1,22 @@
 # commands/views.py
 import re
-from django.shortcuts import render, redirect
+import time
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import HttpResponseBadRequest
+from django.db.models import Q
+from django.conf import settings
+from django.utils import timezone
 
 from users.models import CustomUser, BannedIP # CustomUserとBannedIPをインポート
+from users.network import invalidate_ban_index, parse_ban_target
 from posts.models import Post
+from posts.archive import request_wipe
 from django.db import transaction
 
+from . import audit
+
 # コマンドのパーミッションマップ
 # 実際の権限レベルと比較する際の基準として使用
 COMMAND_PERMISSIONS = {
@@ -46,12 +54,25 @@ COMMAND_PERMISSIONS = {
     'range': 'admin_op',
 }
 
+def _record_rejected(request, command_name, arguments, started_at, reason):
+    """実行前に拒否したコマンドも、理由を error に入れて監査ログに残す"""
+    audit.record(
+        actor=request.user,
+        command=command_name,
+        arguments=arguments,
+        affected_rows=0,
+        duration_ms=(time.perf_counter() - started_at) * 1000,
+        error=reason,
+    )
+
 @login_required # コマンドはログインユーザーのみ実行可能
 def process_command(request):
     if request.method == 'POST':
+        started_at = time.perf_counter()
         command_text = request.POST.get('command_text', '').strip()
         if not command_text.startswith('/'):
             messages.error(request, "コマンドは'/'で始まる必要があります。")
+            _record_rejected(request, '', command_text, started_at, 'invalid_format')
             return redirect('posts:index')
 
         # コマンドと引数を解析
@@ -66,16 +87,21 @@ def process_command(request):
             # 運営の昇格/降格コマンドなど、ウェブUIで直接実行すべきでないもの
             if command_name in ['admin_op', 'disadmin_op']:
                 messages.error(request, f"コマンド '{command_name}' はウェブUIからは実行できません。管理者サイトを使用してください。")
+                _record_rejected(request, command_name, args_str, started_at, 'web_forbidden')
             else:
                 messages.error(request, f"不明なコマンドです: {command_name}")
+                _record_rejected(request, command_name, args_str, started_at, 'unknown_command')
             return redirect('posts:index')
 
         # 権限チェック
         if not request.user.has_permission(required_permission):
             messages.error(request, f"コマンド '{command_name}' の実行には {required_permission} 以上の権限が必要です。")
+            _record_rejected(request, command_name, args_str, started_at, 'permission_denied')
             return redirect('posts:index')
 
         # --- 各コマンドの処理 ---
+        affected_rows = 0 # 監査ログ用: コマンドで変更された行数
+        error = ''
         try:
             with transaction.atomic(): # コマンド処理をトランザクションで囲む
                 if command_name == 'del':
@@ -93,6 +119,7 @@ def process_command(request):
                                 messages.warning(request, f"無効な投稿番号: {post_id_str} はスキップされました。")
                             except Exception: # Post.DoesNotExist を含む
                                 messages.warning(request, f"投稿番号 {post_id_str} は見つかりませんでした。")
+                        affected_rows = deleted_count
                         if deleted_count > 0:
                             messages.success(request, f"{deleted_count}件の投稿を削除しました。")
                         else:
@@ -110,33 +137,32 @@ def process_command(request):
                             messages.error(request, "/destroy color には色指定が必要です。")
                             return redirect('posts:index')
                         target_color = args[1].lower()
-                        # 色と権限レベルのマッピングを逆引き
-                        target_permission_level = None
-                        for level, color in request.user.color_map.items(): # CustomUserモデルにcolor_mapを持たせるか、ここに定義
-                             if color == target_color:
-                                 target_permission_level = level
-                                 break
-                        if target_permission_level:
-                            # 該当権限のユーザーの投稿を一括削除
-                            posts_to_delete = Post.objects.filter(author__permission_level=target_permission_level)
+                        # 色と権限レベルのマッピングを逆引き (同じ色の権限レベルが複数ある場合は全て対象)
+                        target_levels = [level for level, color in CustomUser.ID_COLOR_MAP.items() if color == target_color]
+                        if target_levels:
+                            # 該当権限のユーザーの投稿を一括削除。投稿者の権限は Post のスナップショット (author_rank) で判定し、JOIN しない
+                            target_ranks = [CustomUser.PERMISSION_RANKS[level] for level in target_levels]
+                            posts_to_delete = Post.objects.filter(author_rank__in=target_ranks)
                             deleted_count, _ = posts_to_delete.delete()
-                            messages.success(request, f"{target_color} ID ({target_permission_level}) の投稿を {deleted_count} 件削除しました。")
+                            affected_rows = deleted_count
+                            messages.success(request, f"{target_color} ID ({', '.join(target_levels)}) の投稿を {deleted_count} 件削除しました。")
                         else:
                             messages.error(request, f"不明な色指定: {target_color}")
 
                     else: # 特定の文字やIDを含む投稿を削除
                         posts_to_delete = Post.objects.filter(Q(title__icontains=condition) | Q(content__icontains=condition) | Q(id__icontains=condition))
                         deleted_count, _ = posts_to_delete.delete()
+                        affected_rows = deleted_count
                         messages.success(request, f"'{condition}' を含む投稿を {deleted_count} 件削除しました。")
 
                 elif command_name == 'clear':
-                    deleted_count, _ = Post.objects.all().delete()
-                    # 投稿番号をリセット (PostgreSQLの場合)
-                    with transaction.atomic():
-                        from django.db import connection
-                        with connection.cursor() as cursor:
-                            cursor.execute("TRUNCATE TABLE posts_post RESTART IDENTITY;")
-                    messages.success(request, f"全ての投稿 ({deleted_count}件) を削除し、投稿番号をリセットしました。")
+                    # アーカイブは永続ディスクを持つ hourly-post-deleter でしか書き出せないため、ここでは削除を依頼するだけにする
+                    _, created = request_wipe(request.user.username)
+                    affected_rows = int(created)
+                    if created:
+                        messages.success(request, f"全投稿の削除を受け付けました。{settings.POST_WIPE_POLL_SECONDS}秒程度でアーカイブして削除し、投稿番号をリセットします。")
+                    else:
+                        messages.info(request, "全投稿の削除は既に受け付けています。削除されるまでお待ちください。")
 
                 elif command_name in ['NG', 'OK']:
                     if not args:
@@ -166,6 +192,7 @@ def process_command(request):
                         target_user = CustomUser.objects.get(username=target_username)
                         target_user.permission_level = command_name # 例: 'speaker'
                         target_user.save()
+                        affected_rows = 1
                         messages.success(request, f"{target_username} の権限を {command_name} に昇格しました。")
                     except CustomUser.DoesNotExist:
                         messages.error(request, f"ユーザー '{target_username}' が見つかりませんでした。")
@@ -194,6 +221,7 @@ def process_command(request):
                             else: # それ以外の降格は、単純に指定レベルに降格
                                 target_user.permission_level = target_level # スピーカー, マネージャーなど
                             target_user.save()
+                            affected_rows = 1
                             messages.success(request, f"{target_username} の権限を {target_level} に降格しました。")
                         else:
                             messages.error(request, f"{target_username} の権限を {target_level} に降格できません。")
@@ -207,6 +235,7 @@ def process_command(request):
                 elif command_name == 'disself':
                     request.user.permission_level = 'blue_id'
                     request.user.save()
+                    affected_rows = 1
                     messages.success(request, "あなたの権限を青IDに降格しました。")
                     return redirect('users:logout') # 権限降格後、再ログインを促す
 
@@ -219,6 +248,7 @@ def process_command(request):
                         target_user = CustomUser.objects.get(username=target_username)
                         target_user.is_active = False # アカウントを非アクティブにする
                         target_user.save()
+                        affected_rows = 1
                         messages.success(request, f"ユーザー '{target_username}' を使用不可能にしました。")
                     except CustomUser.DoesNotExist:
                         messages.error(request, f"ユーザー '{target_username}' が見つかりませんでした。")
@@ -229,17 +259,29 @@ def process_command(request):
                         return redirect('posts:index')
                     target_identifier = args[0]
                     try:
-                        # IPアドレスとしてBANを試みる
-                        if re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", target_identifier): # IPv4の簡単な正規表現
-                            BannedIP.objects.get_or_create(ip_address=target_identifier, defaults={'is_approved_by_admin': False, 'reason': f"コマンドによるBAN by {request.user.username}"})
-                            messages.success(request, f"IPアドレス '{target_identifier}' をBANしました。")
+                        # IPアドレス、または 203.0.113.0/24, 2001:db8::/64 のようなネットワークとしてBANを試みる
+                        ban_target = parse_ban_target(target_identifier)
+                        if ban_target is not None:
+                            ip_address, prefix_length = ban_target
+                            _, created = BannedIP.objects.get_or_create(ip_address=ip_address, prefix_length=prefix_length, defaults={'is_approved_by_admin': False, 'reason': f"コマンドによるBAN by {request.user.username}"})
+                            affected_rows = int(created)
+                            messages.success(request, f"IPアドレス '{ip_address}/{prefix_length}' をBANしました。")
+                        elif '/' in target_identifier:
+                            messages.error(request, f"無効なネットワークです。プレフィックス長は IPv4 で /{settings.BAN_MIN_PREFIX_V4}、IPv6 で /{settings.BAN_MIN_PREFIX_V6} 以上を指定してください。")
                         else:
-                            # 投稿番号として処理
+                            # 投稿番号として処理 (/ban 投稿番号 24 のようにプレフィックス長を指定するとネットワーク単位でBAN)
                             post_id = int(target_identifier)
                             post = get_object_or_404(Post, id=post_id)
                             if post.ip_address:
-                                BannedIP.objects.get_or_create(ip_address=post.ip_address, defaults={'is_approved_by_admin': False, 'reason': f"投稿番号 {post_id} からのBAN by {request.user.username}"})
-                                messages.success(request, f"投稿番号 {post_id} のIPアドレス '{post.ip_address}' をBANしました。")
+                                network = f"{post.ip_address}/{args[1]}" if len(args) > 1 else post.ip_address
+                                ban_target = parse_ban_target(network)
+                                if ban_target is None:
+                                    messages.error(request, f"無効なプレフィックス長です。IPv4 は /{settings.BAN_MIN_PREFIX_V4}、IPv6 は /{settings.BAN_MIN_PREFIX_V6} 以上を指定してください。")
+                                    return redirect('posts:index')
+                                ip_address, prefix_length = ban_target
+                                _, created = BannedIP.objects.get_or_create(ip_address=ip_address, prefix_length=prefix_length, defaults={'is_approved_by_admin': False, 'reason': f"投稿番号 {post_id} からのBAN by {request.user.username}"})
+                                affected_rows = int(created)
+                                messages.success(request, f"投稿番号 {post_id} のIPアドレス '{ip_address}/{prefix_length}' をBANしました。")
                             else:
                                 messages.error(request, f"投稿番号 {post_id} にIPアドレス情報がありません。")
                     except ValueError:
@@ -249,9 +291,11 @@ def process_command(request):
 
                 elif command_name == 'revive':
                     # killされたユーザーをアクティブにする
-                    CustomUser.objects.filter(is_active=False).update(is_active=True)
+                    revived_users = CustomUser.objects.filter(is_active=False).update(is_active=True)
                     # BANされたIPの is_approved_by_admin を全てTrueにするか、エントリを削除するか
-                    BannedIP.objects.update(is_approved_by_admin=True) # 全て承認済みに変更（投稿可能に）
+                    approved_ips = BannedIP.objects.update(is_approved_by_admin=True, updated_at=timezone.now()) # 全て承認済みに変更（投稿可能に）
+                    invalidate_ban_index() # update() はシグナルを発行しないため手動で破棄する
+                    affected_rows = revived_users + approved_ips
                     messages.success(request, "/kill および /ban の効果を全て解除しました。")
 
                 elif command_name == 'reduce':
@@ -292,6 +336,7 @@ def process_command(request):
                         target_user = CustomUser.objects.get(username=target_username)
                         target_user.id_color = color_code
                         target_user.save()
+                        affected_rows = 1
                         messages.success(request, f"ユーザー '{target_username}' の名前の色を {color_code} に変更しました。")
                     except CustomUser.DoesNotExist:
                         messages.error(request, f"ユーザー '{target_username}' が見つかりませんでした。")
@@ -303,6 +348,18 @@ def process_command(request):
                     messages.error(request, f"不明なコマンドです: {command_name}")
 
         except Exception as e:
+            affected_rows = 0 # トランザクションはロールバックされている
+            error = str(e)
             messages.error(request, f"コマンド実行中に予期せぬエラーが発生しました: {e}")
+        finally:
+            # 途中で return した場合も含め、実行したコマンドは全て記録する (書き込みはバッファ経由)
+            audit.record(
+                actor=request.user,
+                command=command_name,
+                arguments=args_str,
+                affected_rows=affected_rows,
+                duration_ms=(time.perf_counter() - started_at) * 1000,
+                error=error,
+            )
 
     return redirect('posts:index')
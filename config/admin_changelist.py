@@ -0,0 +1,165 @@
+# config/admin_changelist.py
+# 数十万件規模のテーブル向けの管理画面一覧 (changelist)。
+# - 件数は PostgreSQL の統計情報 (pg_class.reltuples) による推定値、または上限付きの COUNT で表示する
+# - ページ送りは OFFSET ではなく、並び順のキーを使ったカーソル方式 (?cursor=...)
+# - 1ページあたりのクエリ数が ADMIN_CHANGELIST_QUERY_BUDGET を超えたら警告ログを出す
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+CURSOR_VAR = 'cursor'
+
+
+class EstimatedCountPaginator(Paginator):
+    """絞り込みなしの PostgreSQL では reltuples の推定値、それ以外は ADMIN_COUNT_LIMIT 件までの COUNT を使う"""
+
+    is_estimate = False # reltuples による推定値 (実際より多い場合も少ない場合もある)
+    is_truncated = False # ADMIN_COUNT_LIMIT で打ち切った件数 (実際はそれ以上)
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_COUNT_LIMIT
+        connection = connections[queryset.db]
+        if not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # reltuples は ANALYZE 前だと -1 になる
+            if row and row[0] >= limit:
+                self.is_estimate = True
+                return row[0]
+        count = queryset.order_by()[:limit].count()
+        self.is_truncated = count >= limit
+        return count
+
+
+class CursorChangeList(ChangeList):
+    """model_admin.cursor_ordering (一意なフィールド1つ) をキーにしたカーソル方式のページ送り"""
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR) or None
+        super().__init__(request, *args, **kwargs)
+        # 検索フォームや絞り込みのリンクにカーソルを引き継がない
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_ordering(self, request, queryset):
+        # カーソルの整合性を保つため、列見出しでの並べ替えは受け付けない
+        return [self.model_admin.cursor_ordering]
+
+    def _cursor_field(self):
+        ordering = self.model_admin.cursor_ordering
+        descending = ordering.startswith('-')
+        name = ordering.lstrip('-')
+        field = self.opts.pk if name == 'pk' else self.opts.get_field(name)
+        return name, field, descending
+
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        name, field, descending = self._cursor_field()
+
+        queryset = self.queryset
+        if self.cursor is not None:
+            try:
+                cursor_value = field.to_python(self.cursor)
+            except Exception:
+                cursor_value = None
+            if cursor_value is not None:
+                lookup = f"{name}__lt" if descending else f"{name}__gt"
+                queryset = queryset.filter(**{lookup: cursor_value})
+
+        # 1件多く取得して、次のページがあるかどうかを判定する
+        rows = list(queryset[:self.list_per_page + 1])
+        has_next = len(rows) > self.list_per_page
+        result_list = rows[:self.list_per_page]
+
+        self.result_count = paginator.count
+        self.result_count_is_estimate = paginator.is_estimate
+        self.result_count_is_truncated = paginator.is_truncated
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = has_next or self.cursor is not None
+        self.paginator = paginator
+        self.next_cursor = getattr(result_list[-1], 'pk' if name == 'pk' else field.attname) if has_next else None
+
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+    def next_page_url(self):
+        if self.next_cursor is None:
+            return None
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class ScalableAdminMixin:
+    """
+    大きなテーブル用の ModelAdmin ミックスイン。
+    cursor_ordering に一意なフィールド (例: 'username', '-pk') を、
+    prefix_search_fields に前方一致 (インデックスが効く startswith) で検索するフィールドを指定する。
+    前方一致は大文字・小文字を区別するので、search_help_text にもその旨を書くこと。
+    """
+
+    cursor_ordering = '-pk'
+    prefix_search_fields = ()
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER # 絞り込み項目毎の件数集計を行わない
+    sortable_by = ()
+    change_list_template = 'admin/cursor_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # icontains による全件走査の代わりに、各フィールドの前方一致で検索する
+        search_term = search_term.strip()
+        if not search_term or not self.prefix_search_fields:
+            return queryset, False
+        condition = Q()
+        for field in self.prefix_search_fields:
+            condition |= Q(**{f"{field}__startswith": search_term})
+        return queryset.filter(condition), False
+
+    def changelist_view(self, request, extra_context=None):
+        executed = []
+
+        def count_query(execute, sql, params, many, context):
+            executed.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = super().changelist_view(request, extra_context)
+            # テンプレート描画中のクエリも数えるため、ここで描画する
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+
+        budget = settings.ADMIN_CHANGELIST_QUERY_BUDGET
+        if len(executed) > budget:
+            logger.warning(
+                "%s の一覧で %d 件のクエリが実行されました (上限 %d 件)",
+                self.opts.label, len(executed), budget,
+            )
+        return response
@@ -0,0 +1,58 @@
+# config/db_router.py
+# 読み取り専用のリクエスト (投稿一覧、管理画面の一覧など) をレプリカDBへ振り分けるルーター。
+# どのリクエストがレプリカを使えるかは ReplicaRoutingMiddleware (config/middleware.py) が決める。
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.signals import request_finished
+
+REPLICA_ALIAS = 'replica'
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def set_read_alias(alias):
+    _read_alias.set(alias)
+
+
+def _reset_read_alias(**kwargs):
+    # ストリーミングレスポンスは返却後もクエリを発行するため、リクエスト完了時 (close 時) に戻す
+    _read_alias.set(None)
+
+
+request_finished.connect(_reset_read_alias)
+
+
+def replica_reads(view_func):
+    """レプリカからの読み取りを許可するビューに付けるデコレーター"""
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        return view_func(*args, **kwargs)
+    wrapper.replica_reads = True
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """書き込みは常に default、読み取りはリクエスト毎に決まった接続先 (既定は default) を使う"""
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is not None and alias in settings.DATABASES:
+            return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカは default の複製なので、どちらから読んだオブジェクト同士でも関連付けてよい
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # レプリカのスキーマはレプリケーションで反映されるので、マイグレーションは default にのみ適用する
+        return db == 'default'
@@ -0,0 +1,301 @@
+# config/middleware.py
+import re
+import time
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .db_router import REPLICA_ALIAS, replica_configured, set_read_alias
+
+try:
+    import brotli # 任意依存: 未インストールの場合は gzip のみで応答する
+except ImportError:
+    brotli = None
+
+_ACCEPT_BR_RE = re.compile(r'\bbr\b')
+_ACCEPT_GZIP_RE = re.compile(r'\bgzip\b')
+
+# 空白を保持する必要があるブロック (中身は一切変更しない)
+_PROTECTED_TAGS = (b'pre', b'textarea', b'script', b'style')
+_PROTECTED_OPEN_RE = re.compile(rb'<(' + b'|'.join(_PROTECTED_TAGS) + rb')\b', re.I)
+# タグ間の改行を含む空白 (テンプレートのインデント) を1つの改行に畳む。
+# インライン要素間の空白の意味を変えないよう、完全には削除しない。
+_INTERTAG_WS_RE = re.compile(rb'>[ \t\r\f\v]*\n\s*<')
+
+
+def _compressible(request, response):
+    """圧縮対象のレスポンスかどうかを判定する"""
+    if response.has_header('Content-Encoding'):
+        return False # Whitenoise などで既に圧縮済み
+    if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_LENGTH:
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    return content_type in settings.COMPRESSION_CONTENT_TYPES
+
+
+def _negotiate_encoding(request):
+    accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if brotli is not None and _ACCEPT_BR_RE.search(accept_encoding):
+        return 'br'
+    if _ACCEPT_GZIP_RE.search(accept_encoding):
+        return 'gzip'
+    return None
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def process(self, data):
+        # チャンク毎に flush して、最初のバイトをすぐにクライアントへ届ける
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _GzipEncoder:
+    def __init__(self):
+        # wbits に 16 を加えると gzip ヘッダ付きで出力される
+        self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+_ENCODERS = {'br': _BrotliEncoder, 'gzip': _GzipEncoder}
+
+
+def _encode_sequence(sequence, encoder):
+    for chunk in sequence:
+        data = encoder.process(chunk)
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+async def _aencode_sequence(sequence, encoder):
+    async for chunk in sequence:
+        data = encoder.process(chunk)
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+class CompressionMiddleware:
+    """
+    HTML / JSON レスポンスを brotli または gzip で圧縮する。
+    ストリーミングレスポンスにも対応し、チャンク単位で flush する。
+    しきい値や対象 Content-Type は settings.COMPRESSION_* で設定する。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if not _compressible(request, response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = _negotiate_encoding(request)
+        if encoding is None:
+            return response
+
+        encoder = _ENCODERS[encoding]()
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _aencode_sequence(response.streaming_content, encoder)
+            else:
+                response.streaming_content = _encode_sequence(response.streaming_content, encoder)
+            # 圧縮後の長さは事前に分からない
+            response.headers.pop('Content-Length', None)
+        else:
+            compressed_content = encoder.process(response.content) + encoder.finish()
+            # 圧縮しても小さくならない場合はそのまま返す
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # 圧縮後のボディはバイト単位で一致しないため、強い ETag を弱める
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def minify_html(content):
+    """タグ間のインデント空白を取り除く。pre/textarea/script/style の中身は変更しない。"""
+    minifier = _HtmlMinifier()
+    return minifier.feed(content) + minifier.flush()
+
+
+class _HtmlMinifier:
+    """
+    チャンクを跨いで保護ブロックの開閉状態を保持するミニファイア。
+    閉じていないタグ (例: b'<pr') と末尾の空白は次のチャンクまで持ち越すので、
+    タグの途中やタグ間の空白で分割されたチャンクでも、通常と同じ結果になる。最後に flush() を呼ぶこと。
+    """
+
+    def __init__(self):
+        self._open_tag = None
+        self._pending = b''
+        self._after_tag = False # 直前の出力が '>' で終わっているか
+
+    def feed(self, chunk):
+        data = self._pending + chunk
+        cut = len(data)
+        lt = data.rfind(b'<')
+        if lt != -1 and data.find(b'>', lt) == -1:
+            cut = lt
+        cut = len(data[:cut].rstrip())
+        self._pending = data[cut:]
+        return self._process(data[:cut])
+
+    def flush(self):
+        data, self._pending = self._pending, b''
+        return self._process(data)
+
+    def _process(self, data):
+        if not data:
+            return b''
+        if self._after_tag:
+            # 前のチャンクで出力済みの '>' を補い、チャンク先頭のタグ間空白も畳めるようにする
+            result = self._minify(b'>' + data)[1:]
+        else:
+            result = self._minify(data)
+        if result:
+            self._after_tag = result.endswith(b'>')
+        return result
+
+    def _minify(self, chunk):
+        out = []
+        pos = 0
+        lowered = chunk.lower()
+        while pos < len(chunk):
+            if self._open_tag is not None:
+                end = lowered.find(b'</' + self._open_tag, pos)
+                if end == -1:
+                    out.append(chunk[pos:])
+                    break
+                end = chunk.find(b'>', end)
+                if end == -1:
+                    out.append(chunk[pos:])
+                    break
+                # 閉じタグの '>' は次の区間に含め、直後の空白も畳めるようにする
+                out.append(chunk[pos:end])
+                self._open_tag = None
+                pos = end
+                continue
+            match = _PROTECTED_OPEN_RE.search(chunk, pos)
+            if match is None:
+                out.append(_INTERTAG_WS_RE.sub(b'>\n<', chunk[pos:]))
+                break
+            # 開きタグの '<' までを含めて、直前のタグ間空白も畳む
+            out.append(_INTERTAG_WS_RE.sub(b'>\n<', chunk[pos:match.start() + 1]))
+            self._open_tag = match.group(1).lower()
+            out.append(chunk[match.start() + 1:match.end()])
+            pos = match.end()
+        return b''.join(out)
+
+
+def _minify_sequence(sequence, minifier):
+    for chunk in sequence:
+        data = minifier.feed(chunk)
+        if data:
+            yield data
+    yield minifier.flush()
+
+
+class HtmlMinifyMiddleware:
+    """
+    テンプレート由来の不要な空白を取り除く。
+    CompressionMiddleware より内側 (MIDDLEWARE で後ろ) に配置すること。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if not settings.HTML_MINIFY or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != 'text/html':
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                return response # 非同期ストリームはそのまま流す
+            response.streaming_content = _minify_sequence(response.streaming_content, _HtmlMinifier())
+            return response
+
+        response.content = minify_html(response.content)
+        if response.has_header('Content-Length'):
+            response.headers['Content-Length'] = str(len(response.content))
+        return response
+
+
+_SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    安全なメソッドのリクエストのうち、@replica_reads を付けたビューと管理画面の一覧 (changelist) の読み取りを
+    レプリカへ振り分ける。書き込みを行ったブラウザは REPLICA_PIN_SECONDS 秒間 default に固定し、
+    自分の投稿やモデレーション結果がレプリカの遅延で見えなくなることを防ぐ。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        set_read_alias(None)
+        response = self.get_response(request)
+        if request.method not in _SAFE_METHODS and replica_configured():
+            pin_seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE_NAME,
+                str(time.time() + pin_seconds),
+                max_age=pin_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in _SAFE_METHODS or not replica_configured():
+            return None
+        if self._is_pinned(request):
+            return None
+        if getattr(view_func, 'replica_reads', False) or self._is_admin_changelist(request):
+            set_read_alias(REPLICA_ALIAS)
+        return None
+
+    @staticmethod
+    def _is_pinned(request):
+        pinned_until = request.COOKIES.get(settings.REPLICA_PIN_COOKIE_NAME)
+        if not pinned_until:
+            return False
+        try:
+            return float(pinned_until) > time.time()
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _is_admin_changelist(request):
+        match = request.resolver_match
+        # 管理画面の catch-all など、名前のない URL では url_name が None になる
+        return match is not None and match.namespace == 'admin' and (match.url_name or '').endswith('_changelist')
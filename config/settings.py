@@ -2,6 +2,7 @@
 import os
 import environ
 from pathlib import Path
+from django.contrib.messages import constants as messages
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,6 +27,14 @@ DEBUG = env('DEBUG')
 
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '.onrender.com'] # OnRenderのドメインを追加
 
+# X-Forwarded-For を信用するプロキシのアドレス範囲 (users/network.py)
+# REMOTE_ADDR がこの範囲外なら X-Forwarded-For は無視される。
+TRUSTED_PROXIES = env.list('TRUSTED_PROXIES', default=['127.0.0.0/8', '::1/128', '10.0.0.0/8']) # Render のロードバランサーは 10.0.0.0/8
+BAN_INDEX_TTL = env.float('BAN_INDEX_TTL', default=30.0) # 秒。他ワーカーでのBAN変更はこの時間以内に反映される
+# ネットワーク単位のBANで許可する最短のプレフィックス長 (/0 などで全員をBANしてしまうことを防ぐ)
+BAN_MIN_PREFIX_V4 = env.int('BAN_MIN_PREFIX_V4', default=16)
+BAN_MIN_PREFIX_V6 = env.int('BAN_MIN_PREFIX_V6', default=32)
+
 
 # Application definition
 
@@ -47,6 +56,10 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Whitenoise を追加
+    'config.middleware.CompressionMiddleware', # HTML/JSON の brotli/gzip 圧縮 (Whitenoise の静的ファイルは対象外)
+    'config.middleware.HtmlMinifyMiddleware', # テンプレートの不要な空白を除去 (圧縮より内側に置く)
+    'users.middleware.ClientIPMiddleware', # クライアントIPの解決とBAN照合 (request.client_ip, request.is_ip_banned)
+    'config.middleware.ReplicaRoutingMiddleware', # 読み取り専用リクエストをレプリカへ振り分け (ユーザー読み込みより前に置く)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,6 +96,16 @@ DATABASES = {
     'default': env.db_url(default='sqlite:///db.sqlite3') # ローカル開発用はSQLite
 }
 
+# 読み取り用レプリカ (任意)。REPLICA_DATABASE_URL を指定すると、投稿一覧や管理画面の一覧の読み取りがレプリカへ向かう。
+# ローカルでは例えば sqlite:///replica.sqlite3 を指定して確認できる (config/db_router.py)。
+if env('REPLICA_DATABASE_URL', default=None):
+    DATABASES['replica'] = env.db_url('REPLICA_DATABASE_URL')
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'} # テストでは default をそのまま使う
+
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=5) # 書き込み後、この秒数は default から読む
+REPLICA_PIN_COOKIE_NAME = 'db_pin'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -105,6 +128,23 @@ AUTH_PASSWORD_VALIDATORS = [
 # カスタムユーザーモデルを使用
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# セッションからのユーザー読み込みをワーカー内でキャッシュする (users/backends.py)
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+USER_CACHE_TTL = env.float('USER_CACHE_TTL', default=5.0) # 秒。0 でキャッシュ無効
+USER_CACHE_MAX_SIZE = env.int('USER_CACHE_MAX_SIZE', default=1000) # 0 でキャッシュ無効
+
+
+# Cache / Sessions
+# https://docs.djangoproject.com/en/5.0/topics/http/sessions/#configuring-the-session-engine
+
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://') # 例: redis://... を指定すると全ワーカーで共有
+}
+
+# 既定では署名付きCookieにセッションを保存し、リクエスト毎のセッションテーブル読み込みを無くす。
+# 'django.contrib.sessions.backends.cached_db' や 'django.contrib.sessions.backends.db' も指定可能。
+SESSION_ENGINE = env('SESSION_ENGINE', default='django.contrib.sessions.backends.signed_cookies')
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -126,6 +166,37 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles') # collectstatic で静的フ
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage' # Whitenoise の設定
 
 
+# レスポンス圧縮・HTML最小化の設定 (config/middleware.py)
+COMPRESSION_MIN_LENGTH = env.int('COMPRESSION_MIN_LENGTH', default=1024) # これより小さいレスポンスは圧縮しない (バイト)
+COMPRESSION_CONTENT_TYPES = ('text/html', 'application/json')
+COMPRESSION_GZIP_LEVEL = env.int('COMPRESSION_GZIP_LEVEL', default=6)
+COMPRESSION_BROTLI_QUALITY = env.int('COMPRESSION_BROTLI_QUALITY', default=5) # brotli がインストールされている場合のみ使用
+HTML_MINIFY = env.bool('HTML_MINIFY', default=True)
+
+# 投稿一覧のストリーミング描画 (posts/views.py)
+POST_LIST_STREAMING = env.bool('POST_LIST_STREAMING', default=True) # False にすると従来通り render() で一括描画
+POST_LIST_CHUNK_SIZE = env.int('POST_LIST_CHUNK_SIZE', default=200) # 1回のDB取得・描画で扱う投稿数
+
+# 投稿の削除前アーカイブ (posts/archive.py)
+# アーカイブとチェックポイントは永続ディスク上に置くこと (render.yaml では hourly-post-deleter の /var/data/archives)。
+# 実行毎に消えるディスクでは、途中で失敗した場合の再開もアーカイブの保存もできない。
+POST_ARCHIVE_DIR = env('POST_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archives'))
+POST_ARCHIVE_ROTATE_ROWS = env.int('POST_ARCHIVE_ROTATE_ROWS', default=50000) # 1ファイルあたりの最大投稿数
+POST_ARCHIVE_CHUNK_SIZE = env.int('POST_ARCHIVE_CHUNK_SIZE', default=2000) # サーバーサイドカーソルから一度に取得する件数
+POST_ARCHIVE_RETENTION_DAYS = env.int('POST_ARCHIVE_RETENTION_DAYS', default=30) # これより古いアーカイブは削除 (0 で無期限)
+POST_WIPE_POLL_SECONDS = env.int('POST_WIPE_POLL_SECONDS', default=30) # hourly-post-deleter が /clear の依頼を確認する間隔 (秒)
+
+# コマンド監査ログ (commands/audit.py, compact_command_logs)
+AUDIT_LOG_BATCH_SIZE = env.int('AUDIT_LOG_BATCH_SIZE', default=50) # この件数が溜まったらまとめて書き込む
+AUDIT_LOG_FLUSH_INTERVAL = env.float('AUDIT_LOG_FLUSH_INTERVAL', default=10.0) # 秒。件数に達しなくてもこの間隔でバックグラウンドのスレッドが書き込む
+AUDIT_LOG_COMPACT_AFTER_DAYS = env.int('AUDIT_LOG_COMPACT_AFTER_DAYS', default=7) # これより古いログは日毎の集計に圧縮
+AUDIT_LOG_RETENTION_DAYS = env.int('AUDIT_LOG_RETENTION_DAYS', default=90) # これより古い集計は削除
+
+# 管理画面の一覧 (config/admin_changelist.py)
+ADMIN_COUNT_LIMIT = env.int('ADMIN_COUNT_LIMIT', default=10000) # 件数はここまで数え、超える場合は推定値または「以上」で表示
+ADMIN_CHANGELIST_QUERY_BUDGET = env.int('ADMIN_CHANGELIST_QUERY_BUDGET', default=10) # 1ページあたりのクエリ数の上限 (超えると警告ログ)
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
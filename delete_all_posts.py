@@ -1,27 +1,53 @@
 # delete_all_posts.py
 import os
+import sys
+import time
 import django
-from django.conf import settings
-from django.db import connection
 
 # Django環境をセットアップ
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
-from posts.models import Post
+from django.conf import settings
+from django.db import close_old_connections
 
-if __name__ == '__main__':
+from posts.archive import archive_and_wipe, has_pending_wipe_request
+
+
+def run():
     try:
-        # 全ての投稿を削除
-        num_deleted, _ = Post.objects.all().delete()
-        print(f"{num_deleted}件の投稿を削除しました。")
-
-        # PostgreSQLのシーケンスをリセットして投稿番号をリセット
-        # 注意: これはテーブルのデータを完全に削除し、IDシーケンスをリセットします。
-        # 本番環境での使用は慎重に。
-        with connection.cursor() as cursor:
-            cursor.execute("TRUNCATE TABLE posts_post RESTART IDENTITY;")
+        # 全ての投稿をアーカイブしてから削除し、投稿番号をリセットする
+        # アーカイブに失敗した場合は削除しない (POST_ARCHIVE_DIR が永続ディスクなら次回はチェックポイントから再開する)
+        num_deleted = archive_and_wipe()
+        print(f"{num_deleted}件の投稿をアーカイブして削除しました。")
         print("投稿番号をリセットしました。")
 
     except Exception as e:
         print(f"投稿の削除中にエラーが発生しました: {e}")
+
+
+def _next_hour():
+    now = time.time()
+    return now - now % 3600 + 3600
+
+
+def run_hourly():
+    # Render の Cron Job には永続ディスクを付けられないため、ディスク付きの Background Worker から
+    # --hourly を付けて起動し、毎時0分に実行する。/clear の依頼 (PostWipeRequest) も POST_WIPE_POLL_SECONDS 毎に確認して処理する
+    next_run = _next_hour()
+    while True:
+        time.sleep(max(0, min(settings.POST_WIPE_POLL_SECONDS, next_run - time.time())))
+        close_old_connections() # 待機中に切断された接続を再利用しない
+        if time.time() >= next_run:
+            next_run = _next_hour()
+        elif not has_pending_wipe_request():
+            continue
+        run()
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    if '--hourly' in sys.argv[1:]:
+        run_hourly()
+    else:
+        run()
@@ -0,0 +1,280 @@
+# posts/archive.py
+# 投稿の削除前アーカイブ。
+# 投稿を id 順にサーバーサイドカーソルで読み出し、gzip 圧縮した JSONL ファイルへ一定件数毎にローテーションしながら書き出す。
+# ファイルを閉じる度にチェックポイントを保存するので、POST_ARCHIVE_DIR が永続ディスク上にあれば途中で失敗しても続きから再開できる。
+#
+# ファイル名: posts-<最初の投稿日時>-<最後の投稿日時>-<実行ID>-<連番>.jsonl.gz (日時はUTC)
+# 読み出し側 (iter_archived_posts) はファイル名の日時だけで対象外のファイルを読み飛ばす。
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Post, PostWipeRequest
+
+logger = logging.getLogger(__name__)
+
+_TIMESTAMP_FORMAT = '%Y%m%dT%H%M%SZ'
+_CHECKPOINT_NAME = 'checkpoint.json'
+_FIELDS = (
+    'id', 'title', 'content', 'created_at', 'ip_address',
+    'author_id', 'author__username', 'author__display_hash', 'author__permission_level',
+)
+
+
+def _format_timestamp(value):
+    return value.astimezone(dt_timezone.utc).strftime(_TIMESTAMP_FORMAT)
+
+
+def _parse_timestamp(value):
+    return datetime.strptime(value, _TIMESTAMP_FORMAT).replace(tzinfo=dt_timezone.utc)
+
+
+def _to_record(row):
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'content': row['content'],
+        'created_at': row['created_at'].isoformat(),
+        'ip_address': row['ip_address'],
+        'author': {
+            'id': row['author_id'],
+            'username': row['author__username'],
+            'display_hash': row['author__display_hash'],
+            'permission_level': row['author__permission_level'],
+        },
+    }
+
+
+class _ArchiveFile:
+    """書き込み中は .part として書き、閉じる時に日時範囲を含む名前へ変更する"""
+
+    def __init__(self, archive_dir, run_id, seq):
+        self.archive_dir = archive_dir
+        self.run_id = run_id
+        self.seq = seq
+        self.part_path = os.path.join(archive_dir, f"posts-{run_id}-{seq:05d}.jsonl.gz.part")
+        self._file = gzip.open(self.part_path, 'wt', encoding='utf-8')
+        self.count = 0
+        self.first_created_at = None
+        self.last_created_at = None
+        self.last_id = None
+        self.gaps = []
+
+    def write(self, row, previous_id):
+        self._file.write(json.dumps(_to_record(row), ensure_ascii=False))
+        self._file.write('\n')
+        created_at = row['created_at']
+        if self.first_created_at is None or created_at < self.first_created_at:
+            self.first_created_at = created_at
+        if self.last_created_at is None or created_at > self.last_created_at:
+            self.last_created_at = created_at
+        if row['id'] > previous_id:
+            if row['id'] > previous_id + 1:
+                # 欠番 (削除済み、または書き出し時点で未コミットの投稿)
+                self.gaps.append([previous_id + 1, row['id'] - 1])
+            self.last_id = row['id']
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        name = (
+            f"posts-{_format_timestamp(self.first_created_at)}-{_format_timestamp(self.last_created_at)}"
+            f"-{self.run_id}-{self.seq:05d}.jsonl.gz"
+        )
+        path = os.path.join(self.archive_dir, name)
+        os.replace(self.part_path, path)
+        return path
+
+
+def _checkpoint_path(archive_dir):
+    return os.path.join(archive_dir, _CHECKPOINT_NAME)
+
+
+def _load_checkpoint(archive_dir):
+    try:
+        with open(_checkpoint_path(archive_dir), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(archive_dir, checkpoint):
+    tmp_path = _checkpoint_path(archive_dir) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _checkpoint_path(archive_dir))
+
+
+def _clear_checkpoint(archive_dir):
+    try:
+        os.remove(_checkpoint_path(archive_dir))
+    except FileNotFoundError:
+        pass
+
+
+def export_posts(archive_dir=None, chunk_size=None, rotate_rows=None, include_gaps=False):
+    """
+    チェックポイント以降の投稿を id 順に書き出し、更新後のチェックポイントを返す。
+    書き出しが完了していない .part ファイルは前回の失敗の残骸なので削除してやり直す。
+    include_gaps=True の場合は、これまでの書き出しで欠番だった id の投稿も書き出す。
+    """
+    archive_dir = archive_dir or settings.POST_ARCHIVE_DIR
+    chunk_size = chunk_size or settings.POST_ARCHIVE_CHUNK_SIZE
+    rotate_rows = rotate_rows or settings.POST_ARCHIVE_ROTATE_ROWS
+    os.makedirs(archive_dir, exist_ok=True)
+
+    checkpoint = _load_checkpoint(archive_dir) or {
+        'run_id': _format_timestamp(datetime.now(dt_timezone.utc)),
+        'last_id': 0,
+        'seq': 0,
+        'exported': 0,
+        'gaps': [],
+    }
+    checkpoint.setdefault('gaps', [])
+    for name in os.listdir(archive_dir):
+        if name.endswith('.part'):
+            os.remove(os.path.join(archive_dir, name))
+
+    # PostgreSQL では iterator() がサーバーサイドカーソルを使うため、件数に関わらずメモリ使用量は一定
+    condition = Q(id__gt=checkpoint['last_id'])
+    if include_gaps:
+        for start, end in checkpoint['gaps']:
+            condition |= Q(id__range=(start, end))
+    rows = (
+        Post.objects
+        .filter(condition)
+        .order_by('id')
+        .values(*_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    archive_file = None
+    previous_id = checkpoint['last_id']
+    for row in rows:
+        if archive_file is None:
+            archive_file = _ArchiveFile(archive_dir, checkpoint['run_id'], checkpoint['seq'] + 1)
+        archive_file.write(row, previous_id)
+        previous_id = max(previous_id, row['id'])
+        if archive_file.count >= rotate_rows:
+            _commit_file(archive_dir, archive_file, checkpoint)
+            archive_file = None
+    if archive_file is not None:
+        _commit_file(archive_dir, archive_file, checkpoint)
+    return checkpoint
+
+
+def _commit_file(archive_dir, archive_file, checkpoint):
+    archive_file.close()
+    if archive_file.last_id is not None:
+        checkpoint['last_id'] = archive_file.last_id
+    checkpoint['gaps'].extend(archive_file.gaps)
+    checkpoint['seq'] = archive_file.seq
+    checkpoint['exported'] += archive_file.count
+    _save_checkpoint(archive_dir, checkpoint)
+
+
+def archive_and_wipe(archive_dir=None):
+    """
+    全投稿をアーカイブしてから削除し、投稿番号をリセットする。削除した件数を返す。
+    まずロックなしで大半を書き出し、その間に増えた分だけをテーブルロック中に書き出してから削除する。
+    id は INSERT 時に採番されコミット順とは一致しないため、ロックなしの書き出し時点で未コミットだった投稿は
+    欠番として記録しておき、ロック中に改めて書き出す。
+    開始時点で未処理だった /clear の依頼 (PostWipeRequest) は、この削除で処理済みにする。
+    """
+    archive_dir = archive_dir or settings.POST_ARCHIVE_DIR
+    # ディスクが一杯になって書き出し (と削除) が止まらないよう、先に保存期間を過ぎたファイルを消す
+    prune_archives(archive_dir)
+    pending_requests = list(PostWipeRequest.objects.filter(completed_at__isnull=True).values_list('pk', flat=True))
+    export_posts(archive_dir)
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # 書き出しから削除までの間に投稿されたものが消えないよう、新規投稿を止める
+                cursor.execute("LOCK TABLE posts_post IN EXCLUSIVE MODE;")
+        # EXCLUSIVE ロックは投稿中のトランザクションの終了を待つので、この時点で欠番はコミット済みか存在しないかのどちらか
+        checkpoint = export_posts(archive_dir, include_gaps=True)
+        # 削除と同時にIDが振り直されるため、コミット前にチェックポイントを消しておく。
+        # コミットに失敗した場合は次回に全件を書き出し直す (重複はしても欠損はしない)。
+        _clear_checkpoint(archive_dir)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("TRUNCATE TABLE posts_post RESTART IDENTITY;")
+        else:
+            Post.objects.all().delete()
+        PostWipeRequest.objects.filter(pk__in=pending_requests).update(
+            completed_at=timezone.now(), deleted_count=checkpoint['exported'],
+        )
+    return checkpoint['exported']
+
+
+def request_wipe(requested_by):
+    """全投稿削除を依頼する。未処理の依頼が既にあればそれを返す。(依頼, 新規作成したか) を返す。"""
+    pending = PostWipeRequest.objects.filter(completed_at__isnull=True).first()
+    if pending is not None:
+        return pending, False
+    return PostWipeRequest.objects.create(requested_by=requested_by), True
+
+
+def has_pending_wipe_request():
+    return PostWipeRequest.objects.filter(completed_at__isnull=True).exists()
+
+
+def _archive_files(archive_dir, since=None, until=None):
+    for name in sorted(os.listdir(archive_dir)):
+        if not (name.startswith('posts-') and name.endswith('.jsonl.gz')):
+            continue
+        parts = name[len('posts-'):-len('.jsonl.gz')].split('-')
+        if len(parts) != 4:
+            continue
+        first_created_at, last_created_at = _parse_timestamp(parts[0]), _parse_timestamp(parts[1])
+        # ファイル名は秒単位に丸めているため、範囲の比較は1秒の余裕を持たせる
+        if since is not None and last_created_at.timestamp() + 1 <= since.timestamp():
+            continue
+        if until is not None and first_created_at >= until:
+            continue
+        yield os.path.join(archive_dir, name)
+
+
+def prune_archives(archive_dir=None, retention_days=None):
+    """最後の投稿日時が POST_ARCHIVE_RETENTION_DAYS 日より前のアーカイブファイルを削除し、削除したファイル数を返す"""
+    archive_dir = archive_dir or settings.POST_ARCHIVE_DIR
+    retention_days = settings.POST_ARCHIVE_RETENTION_DAYS if retention_days is None else retention_days
+    if retention_days <= 0 or not os.path.isdir(archive_dir):
+        return 0
+    cutoff = datetime.now(dt_timezone.utc) - timedelta(days=retention_days)
+    # until より前に始まるファイルだけが候補になる。ファイル全体が cutoff より前かどうかは最後の投稿日時で判定する
+    removed = 0
+    for path in _archive_files(archive_dir, until=cutoff):
+        last_created_at = _parse_timestamp(os.path.basename(path)[len('posts-'):].split('-')[1])
+        if last_created_at < cutoff:
+            os.remove(path)
+            removed += 1
+    if removed:
+        logger.info("保存期間を過ぎたアーカイブを %d 件削除しました", removed)
+    return removed
+
+
+def iter_archived_posts(archive_dir=None, since=None, until=None):
+    """
+    アーカイブから since <= created_at < until の投稿を1件ずつ返す (辞書)。
+    ファイルは1行ずつ読むので、アーカイブ全体をメモリに載せることはない。
+    """
+    archive_dir = archive_dir or settings.POST_ARCHIVE_DIR
+    for path in _archive_files(archive_dir, since, until):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                created_at = datetime.fromisoformat(record['created_at'])
+                if since is not None and created_at < since:
+                    continue
+                if until is not None and created_at >= until:
+                    continue
+                yield record
@@ -0,0 +1,22 @@
+# posts/management/commands/archive_posts.py
+from django.core.management.base import BaseCommand
+
+from posts.archive import archive_and_wipe, export_posts
+
+
+class Command(BaseCommand):
+    help = '投稿を圧縮JSONLファイルへアーカイブします。--wipe を付けるとアーカイブ後に全投稿を削除します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', dest='archive_dir', help='出力先ディレクトリ (既定: settings.POST_ARCHIVE_DIR)')
+        parser.add_argument('--wipe', action='store_true', help='アーカイブ後に全投稿を削除し、投稿番号をリセットする')
+
+    def handle(self, *args, **options):
+        if options['wipe']:
+            exported = archive_and_wipe(options['archive_dir'])
+            self.stdout.write(self.style.SUCCESS(f"{exported}件の投稿をアーカイブして削除しました。"))
+        else:
+            checkpoint = export_posts(options['archive_dir'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{checkpoint['exported']}件の投稿をアーカイブしました。(投稿番号 {checkpoint['last_id']} まで)"
+            ))
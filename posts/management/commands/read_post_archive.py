@@ -0,0 +1,34 @@
+# posts/management/commands/read_post_archive.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.archive import iter_archived_posts
+
+
+def _parse_datetime_option(value):
+    if value is None:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise CommandError(f"日時の形式が不正です: {value} (例: 2024-01-01T09:00)")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed) # タイムゾーン指定がなければ TIME_ZONE とみなす
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'アーカイブから指定期間の投稿を JSONL で出力します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', dest='archive_dir', help='アーカイブのディレクトリ (既定: settings.POST_ARCHIVE_DIR)')
+        parser.add_argument('--since', help='この日時以降の投稿 (例: 2024-01-01T09:00)')
+        parser.add_argument('--until', help='この日時より前の投稿')
+
+    def handle(self, *args, **options):
+        since = _parse_datetime_option(options['since'])
+        until = _parse_datetime_option(options['until'])
+        for record in iter_archived_posts(options['archive_dir'], since=since, until=until):
+            self.stdout.write(json.dumps(record, ensure_ascii=False))
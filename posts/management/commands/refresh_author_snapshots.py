@@ -0,0 +1,17 @@
+# posts/management/commands/refresh_author_snapshots.py
+from django.core.management.base import BaseCommand
+
+from posts.models import Post, author_snapshot
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = '全投稿の投稿者スナップショット (author_name, author_hash, author_color, author_rank) を最新の状態に更新します。'
+
+    def handle(self, *args, **options):
+        updated = 0
+        authors = CustomUser.objects.filter(posts__isnull=False).distinct()
+        for author in authors.iterator():
+            snapshot = author_snapshot(author)
+            updated += Post.objects.filter(author_id=author.pk).exclude(**snapshot).update(**snapshot)
+        self.stdout.write(self.style.SUCCESS(f"{updated}件の投稿のスナップショットを更新しました。"))
@@ -1,7 +1,23 @@
 # posts/models.py
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from users.models import CustomUser # カスタムユーザーモデルをインポート
 
+# 投稿者スナップショットの元になる CustomUser のフィールド
+AUTHOR_SNAPSHOT_SOURCE_FIELDS = frozenset({'username', 'display_hash', 'id_color', 'permission_level'})
+
+
+def author_snapshot(author):
+    """Post に複製して保存する投稿者情報 (一覧表示で CustomUser を JOIN しないため)"""
+    return {
+        'author_name': author.username,
+        'author_hash': author.display_hash,
+        'author_color': author.id_color,
+        'author_rank': CustomUser.PERMISSION_RANKS.get(author.permission_level, 0),
+    }
+
+
 class Post(models.Model):
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='posts', verbose_name='投稿者')
     title = models.CharField(
@@ -16,12 +32,60 @@ class Post(models.Model):
         blank=True,
         null=True,
         verbose_name='IPアドレス',
-        protocol='IPv4' # 必要に応じて 'both' に変更
+        protocol='both', # IPv4 / IPv6 の両方を保存する
+        unpack_ipv4=True # ::ffff:a.b.c.d は IPv4 として保存
     )
+    # 投稿者スナップショット (投稿時に書き込み、CustomUser の変更時に sync_author_snapshot で一括更新)
+    author_name = models.CharField(max_length=150, default='', editable=False, verbose_name='投稿者名')
+    author_hash = models.CharField(max_length=7, blank=True, null=True, editable=False, verbose_name='投稿者ハッシュ')
+    author_color = models.CharField(max_length=20, default='blue', editable=False, verbose_name='投稿者ID表示色')
+    author_rank = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='投稿者権限ランク')
 
     def __str__(self):
         display_title = self.title if self.title else "(タイトルなし)"
-        return f"No.{self.id}: {display_title} by {self.author.username}"
+        return f"No.{self.id}: {display_title} by {self.author_name}"
+
+    # 新規投稿時に投稿者スナップショットを書き込む
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.author_id is not None:
+            for field, value in author_snapshot(self.author).items():
+                setattr(self, field, value)
+        super().save(*args, **kwargs)
 
     class Meta:
-        ordering = ['-created_at'] # 新しい投稿が上に来るように
+        ordering = ['-created_at', '-id'] # 新しい投稿が上に来るように (同時刻の投稿は番号順)
+        indexes = [
+            # 投稿一覧の並び順と同じ向きのインデックス。一覧は posts_post のみを読む。
+            models.Index(fields=['-created_at', '-id'], name='post_listing_idx'),
+        ]
+
+
+class PostWipeRequest(models.Model):
+    """
+    /clear で受け付けた全投稿削除の依頼。アーカイブは永続ディスクを持つ hourly-post-deleter でしか
+    書き出せないため、Webリクエストでは依頼を記録するだけにし、削除は delete_all_posts.py が行う。
+    """
+    requested_by = models.CharField(max_length=150, verbose_name='依頼者')
+    requested_at = models.DateTimeField(auto_now_add=True, verbose_name='依頼日時')
+    completed_at = models.DateTimeField(blank=True, null=True, verbose_name='削除日時')
+    deleted_count = models.PositiveIntegerField(blank=True, null=True, verbose_name='削除件数')
+
+    def __str__(self):
+        return f"{self.requested_by} による全投稿削除の依頼 ({self.requested_at})"
+
+    class Meta:
+        ordering = ['-requested_at']
+        verbose_name = '全投稿削除の依頼'
+        verbose_name_plural = '全投稿削除の依頼'
+
+
+# 投稿者の表示に関わる項目が変わったら、その投稿者の全投稿のスナップショットを一括で更新する
+@receiver(post_save, sender=CustomUser)
+def sync_author_snapshot(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return # 新規ユーザーにはまだ投稿がない
+    if update_fields is not None and not AUTHOR_SNAPSHOT_SOURCE_FIELDS.intersection(update_fields):
+        return # last_login の更新などは対象外
+    snapshot = author_snapshot(instance)
+    # 既に最新の行は書き換えない
+    Post.objects.filter(author_id=instance.pk).exclude(**snapshot).update(**snapshot)
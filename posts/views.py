@@ -1,5 +1,9 @@
 # posts/views.py
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import get_template, render_to_string
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from datetime import timedelta
@@ -7,31 +11,51 @@ import hashlib
 from django.contrib import messages
 from django.db import transaction # トランザクション処理のため
 
+from config.db_router import replica_reads
 from .models import Post
 from .forms import PostForm
-from users.models import BannedIP # BannedIPモデルを使用
+from users.network import get_client_ip, is_ip_banned # クライアントIPの解決とBAN照合
 
-# IPアドレスを確実に取得するヘルパー関数
-def get_client_ip(request):
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0].strip()
-    else:
-        ip = request.META.get('REMOTE_ADDR')
 
-    if ip and ':' in ip and '.' in ip:
-        try:
-            ip = ip.rsplit(':', 1)[-1]
-        except ValueError:
-            pass
-    return ip if ip else 'Unknown'
+def _stream_post_list(header, posts, context):
+    # ヘッダー (フォームを含む) を最初に送り、続けて投稿を chunk_size 件ずつ描画して送る
+    yield header
+    posts_template = get_template('posts/_posts.html')
+    chunk_size = settings.POST_LIST_CHUNK_SIZE
+    batch = []
+    has_posts = False
+    for post in posts.iterator(chunk_size=chunk_size):
+        batch.append(post)
+        if len(batch) >= chunk_size:
+            yield posts_template.render({**context, 'posts': batch})
+            batch = []
+            has_posts = True
+    if batch:
+        yield posts_template.render({**context, 'posts': batch})
+        has_posts = True
+    yield render_to_string('posts/_footer.html', {'has_posts': has_posts})
 
 
+@replica_reads # 読み取りのみなのでレプリカから読んでよい
 def post_list(request):
-    posts = Post.objects.all()
+    # 投稿者情報は Post のスナップショットを使うので、users_customuser は読まない
+    posts = Post.objects.only('id', 'title', 'content', 'created_at', 'author_name', 'author_hash', 'author_color')
     # ユーザー認証済みの場合、投稿フォームを渡す
     form = PostForm() if request.user.is_authenticated else None
-    return render(request, 'posts/index.html', {'posts': posts, 'form': form})
+    # テンプレートでは引数付きのメソッド呼び出しができないため、ビューで判定しておく
+    can_delete_posts = request.user.is_authenticated and request.user.has_permission('manager')
+
+    if not settings.POST_LIST_STREAMING:
+        return render(request, 'posts/index.html', {'posts': posts, 'form': form, 'can_delete_posts': can_delete_posts})
+
+    # ヘッダーはここで描画する。メッセージの既読処理やセッション更新は
+    # ビューが返った直後に行われるため、ストリーミング中に描画すると間に合わない。
+    header = render_to_string('posts/_header.html', {'form': form}, request)
+    # 投稿部分はコンテキストプロセッサを通さずに描画するので、必要な値を先に確定させる
+    post_context = {'can_delete_posts': can_delete_posts}
+    if can_delete_posts:
+        post_context['csrf_token'] = get_token(request)
+    return StreamingHttpResponse(_stream_post_list(header, posts, post_context))
 
 @login_required # ログインが必須
 def create_post(request):
@@ -45,14 +69,13 @@ def create_post(request):
             current_ip = get_client_ip(request)
 
             # --- BANされているIPかチェック ---
-            if current_ip and current_ip != 'Unknown':
-                try:
-                    banned_ip_entry = BannedIP.objects.get(ip_address=current_ip)
-                    if not banned_ip_entry.is_approved_by_admin:
-                        messages.error(request, "あなたのIPアドレスからの投稿は制限されています。運営の承認が必要です。")
-                        return redirect('posts:index')
-                except BannedIP.DoesNotExist:
-                    pass
+            # ClientIPMiddleware で判定済み。アドレス単位に加え /24, /64 などのネットワーク単位のBANも照合する。
+            banned = getattr(request, 'is_ip_banned', None)
+            if banned is None:
+                banned = current_ip is not None and is_ip_banned(current_ip)
+            if banned:
+                messages.error(request, "あなたのIPアドレスからの投稿は制限されています。運営の承認が必要です。")
+                return redirect('posts:index')
 
             # --- 重複投稿チェック ---
             # 投稿内容のハッシュを生成（長文でも固定長で比較するため）
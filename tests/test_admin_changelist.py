@@ -0,0 +1,37 @@
+# tests/test_admin_changelist.py
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from users.cache import clear_user_cache
+from users.models import BannedIP, CustomUser
+
+
+class ScalableAdminTests(TestCase):
+
+    def setUp(self):
+        clear_user_cache() # 前のテストと同じ pk のユーザーがキャッシュに残らないようにする
+        self.admin = CustomUser.objects.create_superuser(username='admin', password='x', email='admin@example.com')
+        self.client.force_login(self.admin)
+
+    def test_network_search_without_postgresql(self):
+        BannedIP.objects.create(ip_address='203.0.113.0', prefix_length=24)
+        BannedIP.objects.create(ip_address='203.0.113.77')
+        BannedIP.objects.create(ip_address='198.51.100.1')
+        BannedIP.objects.create(ip_address='2001:db8::1')
+
+        response = self.client.get(reverse('admin:users_bannedip_changelist'), {'q': '203.0.113.0/24'})
+
+        self.assertEqual(
+            sorted(ban.network for ban in response.context['cl'].result_list),
+            ['203.0.113.0/24', '203.0.113.77/32'],
+        )
+
+    @override_settings(ADMIN_COUNT_LIMIT=2)
+    def test_truncated_count_is_labelled_as_lower_bound(self):
+        CustomUser.objects.create_user(username='a', password='x')
+        CustomUser.objects.create_user(username='b', password='x')
+
+        response = self.client.get(reverse('admin:users_customuser_changelist'))
+
+        self.assertContains(response, '2 件以上')
+        self.assertNotContains(response, '約 2 件')
@@ -0,0 +1,48 @@
+# tests/test_author_snapshot.py
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+from users.cache import clear_user_cache
+from users.models import CustomUser
+
+
+class AuthorSnapshotTests(TestCase):
+
+    def setUp(self):
+        clear_user_cache() # 前のテストと同じ pk のユーザーがキャッシュに残らないようにする
+        self.author = CustomUser.objects.create_user(username='author', password='x')
+        self.post = Post.objects.create(author=self.author, content='hello')
+
+    def test_snapshot_is_written_on_create(self):
+        self.assertEqual(
+            (self.post.author_name, self.post.author_color, self.post.author_rank),
+            ('author', 'blue', 0),
+        )
+
+    def test_permission_change_updates_existing_posts(self):
+        self.author.permission_level = 'moderator'
+        self.author.save()
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.author_color, self.post.author_rank), ('purple', 3))
+
+    def test_last_login_save_does_not_update_posts(self):
+        Post.objects.filter(pk=self.post.pk).update(author_name='stale')
+        self.author.username = 'renamed' # update_fields に含まれないので保存されない
+        with self.assertNumQueries(1): # UPDATE users_customuser のみ
+            self.author.save(update_fields=['last_login'])
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.author_name, 'stale')
+
+    @override_settings(AUDIT_LOG_BATCH_SIZE=1)
+    def test_destroy_color_uses_author_rank(self):
+        speaker = CustomUser.objects.create_user(username='speaker', password='x', permission_level='speaker')
+        Post.objects.create(author=speaker, content='speaker post')
+        moderator = CustomUser.objects.create_user(username='mod', password='x', permission_level='moderator')
+        self.client.force_login(moderator)
+
+        self.client.post(reverse('commands:process_command'), {'command_text': '/destroy color darkorange'})
+
+        self.assertEqual(list(Post.objects.values_list('content', flat=True)), ['hello'])
@@ -0,0 +1,96 @@
+# tests/test_ban_network.py
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from users import network
+from users.models import BannedIP
+from users.network import BanIndex, is_ip_banned, parse_ban_target
+
+
+@override_settings(BAN_MIN_PREFIX_V4=16, BAN_MIN_PREFIX_V6=32)
+class ParseBanTargetTests(SimpleTestCase):
+
+    def test_single_address(self):
+        self.assertEqual(parse_ban_target('203.0.113.5'), ('203.0.113.5', 32))
+        self.assertEqual(parse_ban_target('::ffff:203.0.113.5'), ('203.0.113.5', 32))
+
+    def test_network_is_normalized(self):
+        self.assertEqual(parse_ban_target('203.0.113.5/24'), ('203.0.113.0', 24))
+        self.assertEqual(parse_ban_target('2001:db8::1/64'), ('2001:db8::', 64))
+
+    def test_too_broad_prefix_is_rejected(self):
+        self.assertIsNone(parse_ban_target('0.0.0.0/0'))
+        self.assertIsNone(parse_ban_target('10.0.0.0/8'))
+        self.assertIsNone(parse_ban_target('::/0'))
+        self.assertIsNone(parse_ban_target('2001:db8::/16'))
+        self.assertEqual(parse_ban_target('10.1.0.0/16'), ('10.1.0.0', 16))
+
+    def test_invalid(self):
+        self.assertIsNone(parse_ban_target('not-an-ip'))
+        self.assertIsNone(parse_ban_target('203.0.113.0/33'))
+
+    def test_clean_rejects_too_broad_prefix(self):
+        with self.assertRaises(ValidationError):
+            BannedIP(ip_address='10.0.0.0', prefix_length=8).clean()
+
+
+@override_settings(BAN_MIN_PREFIX_V4=16, BAN_MIN_PREFIX_V6=32)
+class BanIndexTests(SimpleTestCase):
+
+    def test_bad_rows_are_skipped(self):
+        with self.assertLogs('users.network', 'WARNING'):
+            index = BanIndex([('broken', None), ('10.0.0.0', 8), ('203.0.113.0', 24)])
+        self.assertIn('203.0.113.9', index)
+        self.assertNotIn('10.1.2.3', index)
+
+
+@override_settings(BAN_MIN_PREFIX_V4=16, BAN_MIN_PREFIX_V6=32, BAN_INDEX_TTL=3600)
+class BannedIPTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(network, '_ban_index', network._BanIndexCache())
+        self.ban_index = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_save_rejects_invalid_target(self):
+        with self.assertRaises(ValidationError):
+            BannedIP(ip_address='10.0.0.0', prefix_length=8).save()
+        with self.assertRaises(ValidationError):
+            BannedIP(ip_address='not-an-ip').save()
+        self.assertFalse(BannedIP.objects.exists())
+
+    def test_index_is_invalidated_after_commit(self):
+        self.assertFalse(is_ip_banned('203.0.113.9'))
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            BannedIP.objects.create(ip_address='203.0.113.0', prefix_length=24)
+            # コミット前はインデックスを作り直さない
+            self.assertFalse(is_ip_banned('203.0.113.9'))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(is_ip_banned('203.0.113.9'))
+
+    def test_index_is_rebuilt_only_when_bans_change(self):
+        BannedIP.objects.create(ip_address='203.0.113.0', prefix_length=24)
+        with mock.patch.object(network._BanIndexCache, '_build', autospec=True, side_effect=network._BanIndexCache._build) as build:
+            self.assertTrue(is_ip_banned('203.0.113.9'))
+            network._ban_index.invalidate() # TTL 切れと同じ
+            self.assertTrue(is_ip_banned('203.0.113.9'))
+            self.assertEqual(build.call_count, 1) # 変更がなければ作り直さない
+
+            BannedIP.objects.update(is_approved_by_admin=True, updated_at=timezone.now())
+            network._ban_index.invalidate()
+            self.assertFalse(is_ip_banned('203.0.113.9'))
+            self.assertEqual(build.call_count, 2)
+
+    def test_stale_index_is_used_while_another_thread_refreshes(self):
+        BannedIP.objects.create(ip_address='203.0.113.0', prefix_length=24)
+        self.assertTrue(is_ip_banned('203.0.113.9'))
+        BannedIP.objects.all().delete()
+        network._ban_index.invalidate()
+        with self.ban_index._lock: # 他のスレッドが確認中
+            with self.assertNumQueries(0):
+                self.assertTrue(is_ip_banned('203.0.113.9'))
+        self.assertFalse(is_ip_banned('203.0.113.9'))
@@ -0,0 +1,65 @@
+# tests/test_command_audit.py
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from commands import audit
+from commands.models import CommandLog
+from users.cache import clear_user_cache
+from users.models import CustomUser
+
+
+@override_settings(AUDIT_LOG_BATCH_SIZE=1)
+class ProcessCommandAuditTests(TestCase):
+
+    def setUp(self):
+        clear_user_cache() # 前のテストと同じ pk のユーザーがキャッシュに残らないようにする
+        self.user = CustomUser.objects.create_user(username='blue', password='x')
+        self.client.force_login(self.user)
+
+    def run_command(self, command_text):
+        self.client.post(reverse('commands:process_command'), {'command_text': command_text})
+        return CommandLog.objects.latest('executed_at')
+
+    def test_rejected_commands_are_recorded(self):
+        cases = [
+            ('hello', '', 'invalid_format'),
+            ('/admin_op someone', 'admin_op', 'web_forbidden'),
+            ('/ban 203.0.113.5', 'ban', 'permission_denied'),
+            ('/' + 'x' * 40, 'x' * 20, 'unknown_command'),
+        ]
+        for command_text, command, error in cases:
+            with self.subTest(command_text=command_text):
+                log = self.run_command(command_text)
+                self.assertEqual((log.command, log.error, log.actor_username), (command, error, 'blue'))
+        self.assertEqual(CommandLog.objects.count(), len(cases))
+
+
+@override_settings(AUDIT_LOG_BATCH_SIZE=50)
+class AuditBufferTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='blue', password='x')
+        self.addCleanup(audit._buffer.clear)
+
+    def record(self):
+        audit.record(actor=self.user, command='del', arguments='1', affected_rows=1, duration_ms=1.0)
+
+    def test_record_does_not_write_synchronously(self):
+        with mock.patch.object(audit, '_ensure_flusher') as ensure_flusher, self.assertNumQueries(0):
+            self.record()
+        ensure_flusher.assert_called_once()
+        self.assertEqual(len(audit._buffer), 1)
+
+    def test_periodic_flush_writes_and_closes_connection(self):
+        with mock.patch.object(audit, '_ensure_flusher'):
+            self.record()
+        # 1回書き込んだところでループを抜ける
+        with mock.patch.object(audit.time, 'sleep', side_effect=[None, StopIteration]), \
+                mock.patch.object(audit.connections, 'close_all') as close_all:
+            with self.assertRaises(StopIteration):
+                audit._flush_periodically()
+        close_all.assert_called_once()
+        self.assertEqual(CommandLog.objects.count(), 1)
+        self.assertEqual(audit._buffer, [])
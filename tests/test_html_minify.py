@@ -0,0 +1,35 @@
+# tests/test_html_minify.py
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from config.middleware import HtmlMinifyMiddleware, minify_html
+
+DOCUMENT = b'<div>\n  <pre>\n  <b>\n  </b></pre>\n  <p>\n  x</p>\n</div>'
+EXPECTED = b'<div>\n<pre>\n  <b>\n  </b></pre>\n<p>\n  x</p>\n</div>'
+
+
+@override_settings(HTML_MINIFY=True)
+class HtmlMinifyTests(SimpleTestCase):
+
+    def minify_stream(self, chunks):
+        middleware = HtmlMinifyMiddleware(lambda request: StreamingHttpResponse(iter(chunks)))
+        response = middleware(RequestFactory().get('/'))
+        return b''.join(response.streaming_content)
+
+    def test_minify_html(self):
+        self.assertEqual(minify_html(DOCUMENT), EXPECTED)
+
+    def test_chunk_split_inside_opening_tag(self):
+        self.assertEqual(
+            self.minify_stream([b'<div>\n  <pr', b'e>\n  <b>\n  </b></pre>']),
+            b'<div>\n<pre>\n  <b>\n  </b></pre>',
+        )
+
+    def test_every_split_point(self):
+        for i in range(len(DOCUMENT) + 1):
+            with self.subTest(split=i):
+                self.assertEqual(self.minify_stream([DOCUMENT[:i], DOCUMENT[i:]]), EXPECTED)
+
+    def test_non_streaming_response(self):
+        middleware = HtmlMinifyMiddleware(lambda request: HttpResponse(DOCUMENT))
+        self.assertEqual(middleware(RequestFactory().get('/')).content, EXPECTED)
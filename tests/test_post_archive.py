@@ -0,0 +1,72 @@
+# tests/test_post_archive.py
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from posts.archive import archive_and_wipe, export_posts, iter_archived_posts, prune_archives
+from posts.models import Post, PostWipeRequest
+from users.cache import clear_user_cache
+from users.models import CustomUser
+
+
+class ArchiveAndWipeTests(TransactionTestCase):
+
+    def setUp(self):
+        clear_user_cache() # 前のテストと同じ pk のユーザーがキャッシュに残らないようにする
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        self.author = CustomUser.objects.create_user(username='author', password='x')
+
+    def test_late_commit_below_checkpoint_is_archived(self):
+        # id=2 は採番済みだが、ロックなしの書き出し時点ではまだコミットされていない投稿
+        Post.objects.create(id=1, author=self.author, content='1')
+        Post.objects.create(id=3, author=self.author, content='3')
+        export_posts(self.archive_dir)
+        Post.objects.create(id=2, author=self.author, content='2')
+
+        archive_and_wipe(self.archive_dir)
+
+        archived = sorted(record['id'] for record in iter_archived_posts(self.archive_dir))
+        self.assertEqual(archived, [1, 2, 3])
+        self.assertFalse(Post.objects.exists())
+
+    def test_clear_command_only_requests_a_wipe(self):
+        moderator = CustomUser.objects.create_user(username='mod', password='x', permission_level='moderator')
+        self.client.force_login(moderator)
+        Post.objects.create(author=self.author, content='1')
+
+        with override_settings(POST_ARCHIVE_DIR=self.archive_dir, AUDIT_LOG_BATCH_SIZE=1):
+            self.client.post(reverse('commands:process_command'), {'command_text': '/clear'})
+            self.client.post(reverse('commands:process_command'), {'command_text': '/clear'})
+            # Webリクエストでは削除もアーカイブもしない
+            self.assertEqual(Post.objects.count(), 1)
+            self.assertEqual(list(iter_archived_posts()), [])
+            wipe_request = PostWipeRequest.objects.get()
+
+            archive_and_wipe()
+
+        wipe_request.refresh_from_db()
+        self.assertIsNotNone(wipe_request.completed_at)
+        self.assertEqual(wipe_request.deleted_count, 1)
+        self.assertFalse(Post.objects.exists())
+
+
+class PruneArchivesTests(SimpleTestCase):
+
+    def test_old_archives_are_removed(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        names = [
+            'posts-20200101T000000Z-20200101T010000Z-20200101T010000Z-00001.jsonl.gz',
+            'posts-20200101T000000Z-20991231T000000Z-20200101T010000Z-00002.jsonl.gz',
+            'checkpoint.json',
+        ]
+        for name in names:
+            open(os.path.join(archive_dir, name), 'wb').close()
+
+        self.assertEqual(prune_archives(archive_dir, retention_days=30), 1)
+        self.assertEqual(sorted(os.listdir(archive_dir)), sorted(names[1:]))
+        self.assertEqual(prune_archives(archive_dir, retention_days=0), 0)
@@ -0,0 +1,65 @@
+# tests/test_post_list.py
+import re
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+from users.cache import clear_user_cache
+from users.models import CustomUser
+
+_CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+def normalize(html):
+    # CSRF トークンはリクエスト毎に変わり、空白はチャンクの区切り方で変わるため比較から除く
+    return re.sub(r'\s+', '', _CSRF_RE.sub('', html))
+
+
+@override_settings(POST_LIST_CHUNK_SIZE=2, AUDIT_LOG_BATCH_SIZE=1)
+class PostListStreamingTests(TestCase):
+
+    def setUp(self):
+        clear_user_cache() # 前のテストと同じ pk のユーザーがキャッシュに残らないようにする
+        self.manager = CustomUser.objects.create_user(username='manager', password='x', permission_level='manager')
+        for i in range(5):
+            Post.objects.create(author=self.manager, title=f"title {i}", content=f"content {i}")
+
+    def get_list(self, client, streaming):
+        with self.settings(POST_LIST_STREAMING=streaming):
+            response = client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.streaming, streaming)
+        return response.getvalue().decode()
+
+    def test_streaming_matches_render(self):
+        for user in (None, self.manager):
+            with self.subTest(user=user):
+                client = Client()
+                if user is not None:
+                    client.force_login(user)
+                self.assertEqual(
+                    normalize(self.get_list(client, streaming=True)),
+                    normalize(self.get_list(client, streaming=False)),
+                )
+
+    def test_messages_and_delete_form_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.manager)
+        html = self.get_list(client, streaming=True)
+        token = _CSRF_RE.search(html).group(1)
+        client.post(reverse('posts:create_post'), {'content': 'new post', 'csrfmiddlewaretoken': token})
+
+        # ヘッダーはレスポンスを返す前に描画するので、メッセージは表示されて既読になる
+        html = self.get_list(client, streaming=True)
+        self.assertIn('投稿が作成されました。', html)
+        self.assertNotIn('投稿が作成されました。', self.get_list(client, streaming=True))
+
+        # 投稿部分の削除フォームに埋め込まれた CSRF トークンで削除できる
+        post = Post.objects.get(content='new post')
+        delete_form = re.search(r'<form class="delete-form".*?/del %d".*?</form>' % post.pk, html, re.S).group(0)
+        client.post(reverse('commands:process_command'), {
+            'command_text': f"/del {post.pk}",
+            'csrfmiddlewaretoken': _CSRF_RE.search(delete_form).group(1),
+        })
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
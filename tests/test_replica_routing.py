@@ -0,0 +1,76 @@
+# tests/test_replica_routing.py
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.db import connections
+from django.test import TestCase
+from django.urls import reverse
+
+from config.db_router import REPLICA_ALIAS, PrimaryReplicaRouter
+from users.cache import clear_user_cache
+from users.models import CustomUser
+
+
+@mock.patch('config.middleware.replica_configured', return_value=True)
+class ReplicaRoutingMiddlewareTests(TestCase):
+
+    def test_unknown_admin_url(self, replica_configured):
+        # 名前のない管理画面の URL (catch-all) でも 500 にならないこと
+        response = self.client.get('/admin/nonexistent/')
+        self.assertIn(response.status_code, (301, 302, 404))
+
+
+class ReplicaReadsTests(TestCase):
+    """レプリカを default と同じ接続として追加し、ルーターがどちらを選んだかを記録して確かめる"""
+
+    def setUp(self):
+        clear_user_cache() # 前のテストと同じ pk のユーザーがキャッシュに残らないようにする
+        patcher = mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: settings.DATABASES['default']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        connections[REPLICA_ALIAS] = connections['default'] # テストのトランザクションを共有する
+        self.addCleanup(connections.__delitem__, REPLICA_ALIAS)
+        self.user = CustomUser.objects.create_user(username='blue', password='x')
+
+    def read_aliases(self, method, path, **kwargs):
+        aliases = []
+        db_for_read = PrimaryReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            aliases.append(alias)
+            return alias
+
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', spy):
+            response = getattr(self.client, method)(path, **kwargs)
+            # 投稿の読み取りはストリーミング中に行われる
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content, aliases
+
+    def test_replica_reads_view_reads_from_replica(self):
+        response, _, aliases = self.read_aliases('get', reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(REPLICA_ALIAS, aliases)
+        self.assertNotIn('default', aliases)
+
+    def test_write_pins_to_default(self):
+        self.client.force_login(self.user)
+        response, _, aliases = self.read_aliases('post', reverse('posts:create_post'), data={'content': 'hello'})
+        self.assertNotIn(REPLICA_ALIAS, aliases)
+        self.assertIn(settings.REPLICA_PIN_COOKIE_NAME, response.cookies)
+
+        # クッキーはテストクライアントに保存されているので、続く GET は default から読む
+        _, content, aliases = self.read_aliases('get', reverse('posts:index'))
+        self.assertIn('hello', content.decode())
+        self.assertNotIn(REPLICA_ALIAS, aliases)
+
+    def test_expired_pin_reads_from_replica(self):
+        self.client.cookies[settings.REPLICA_PIN_COOKIE_NAME] = str(time.time() - 1)
+        _, _, aliases = self.read_aliases('get', reverse('posts:index'))
+        self.assertIn(REPLICA_ALIAS, aliases)
+
+    def test_replica_is_never_migrated(self):
+        router = PrimaryReplicaRouter()
+        self.assertTrue(router.allow_migrate('default', 'posts'))
+        self.assertFalse(router.allow_migrate(REPLICA_ALIAS, 'posts'))
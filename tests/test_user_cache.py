@@ -0,0 +1,57 @@
+# tests/test_user_cache.py
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from users.backends import CachedModelBackend
+from users.cache import cache_user, clear_user_cache, get_cached_user
+from users.models import CustomUser
+
+
+@override_settings(USER_CACHE_TTL=60.0)
+class UserCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        clear_user_cache()
+        self.addCleanup(clear_user_cache)
+
+    @override_settings(USER_CACHE_MAX_SIZE=0)
+    def test_zero_max_size_disables_cache(self):
+        cache_user(CustomUser(pk=1, username='a'))
+        self.assertIsNone(get_cached_user(1))
+
+    @override_settings(USER_CACHE_MAX_SIZE=2)
+    def test_oldest_entry_is_evicted(self):
+        for pk in (1, 2, 1, 3): # 1 は入れ直したので、追い出されるのは 2
+            cache_user(CustomUser(pk=pk, username=str(pk)))
+        self.assertIsNone(get_cached_user(2))
+        self.assertEqual(get_cached_user(1).username, '1')
+        self.assertEqual(get_cached_user(3).username, '3')
+
+
+@override_settings(USER_CACHE_TTL=60.0, USER_CACHE_MAX_SIZE=1000)
+class CachedModelBackendTests(TestCase):
+
+    def setUp(self):
+        clear_user_cache()
+        self.addCleanup(clear_user_cache)
+        self.backend = CachedModelBackend()
+        self.user = CustomUser.objects.create_user(username='blue', password='x')
+
+    def test_get_user_is_served_from_cache(self):
+        self.assertEqual(self.backend.get_user(self.user.pk).username, 'blue')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk).username, 'blue')
+
+    def test_cache_is_invalidated_after_commit(self):
+        self.backend.get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.permission_level = 'speaker'
+            self.user.save()
+            # コミット前は破棄しない
+            self.assertEqual(self.backend.get_user(self.user.pk).permission_level, 'blue_id')
+        self.assertEqual(self.backend.get_user(self.user.pk).permission_level, 'speaker')
+
+    def test_cache_is_invalidated_after_delete(self):
+        self.backend.get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.filter(pk=self.user.pk).delete()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
@@ -1,10 +1,15 @@
 # users/admin.py
+import ipaddress
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db import connections
+from django.utils import timezone
+from config.admin_changelist import ScalableAdminMixin
 from .models import CustomUser, BannedIP
+from .network import invalidate_ban_index, parse_ban_target
 
 @admin.register(CustomUser)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(ScalableAdminMixin, UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
         (None, {'fields': ('permission_level', 'id_color', 'display_hash')}),
     )
@@ -12,22 +17,56 @@ class CustomUserAdmin(UserAdmin):
         (None, {'fields': ('permission_level', 'id_color', 'display_hash')}),
     )
     list_display = ('username', 'email', 'permission_level', 'id_color', 'display_hash', 'is_staff')
-    list_filter = ('permission_level', 'is_staff', 'is_superuser', 'is_active', 'groups')
+    # groups での絞り込みは多対多の JOIN と DISTINCT が必要になるため外している
+    list_filter = ('permission_level', 'is_staff', 'is_superuser', 'is_active')
     search_fields = ('username', 'email')
+    prefix_search_fields = ('username', 'email') # 前方一致 (config/admin_changelist.py)
+    search_help_text = 'ユーザー名またはメールアドレスの前方一致 (大文字・小文字を区別します)'
     ordering = ('username',)
+    cursor_ordering = 'username'
 
 @admin.register(BannedIP)
-class BannedIPAdmin(admin.ModelAdmin):
-    list_display = ('ip_address', 'is_approved_by_admin', 'banned_at', 'reason')
+class BannedIPAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('ip_address', 'prefix_length', 'is_approved_by_admin', 'banned_at', 'reason')
     list_filter = ('is_approved_by_admin', 'banned_at')
-    search_fields = ('ip_address', 'reason')
+    search_fields = ('ip_address',)
+    search_help_text = 'IPアドレス (完全一致) またはネットワーク (例: 203.0.113.0/24)'
+    cursor_ordering = '-pk' # 新しいBANから順に表示
     actions = ['approve_ban_ip', 'reject_ban_ip']
 
+    def get_search_results(self, request, queryset, search_term):
+        # reason の全文検索は行わず、IPアドレスのインデックスで引ける検索のみ受け付ける
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        target = parse_ban_target(search_term)
+        if target is None:
+            return queryset.none(), False
+        ip_address, prefix_length = target
+        if '/' not in search_term:
+            return queryset.filter(ip_address=ip_address), False
+        network = ipaddress.ip_network(f"{ip_address}/{prefix_length}")
+        if connections[queryset.db].vendor == 'postgresql':
+            # inet 型は大小比較でインデックスを使えるので、ネットワーク内のBANを範囲で探す
+            return queryset.filter(
+                ip_address__gte=str(network.network_address),
+                ip_address__lte=str(network.broadcast_address),
+            ), False
+        # 他のDB (ローカル開発用のSQLiteなど) では文字列で保存されるため、Python側で照合する
+        matched = [
+            pk for pk, address in queryset.values_list('pk', 'ip_address').iterator()
+            if ipaddress.ip_address(address) in network
+        ]
+        return queryset.filter(pk__in=matched), False
+
+    # アクションは絞り込み結果全体 (「全件選択」時) に対しても update() 1回で処理し、行を読み込まない
+
     def approve_ban_ip(self, request, queryset):
         if not request.user.has_permission('admin_op'):
             self.message_user(request, "BAN承認には運営権限が必要です。", level='error')
             return
-        updated = queryset.update(is_approved_by_admin=True)
+        updated = queryset.update(is_approved_by_admin=True, updated_at=timezone.now())
+        invalidate_ban_index()
         self.message_user(request, f"{updated}件のIPアドレスのBANを承認しました。(投稿可能になりました)")
     approve_ban_ip.short_description = "選択したIPのBANを承認する (投稿可能にする)"
 
@@ -35,6 +74,7 @@ class BannedIPAdmin(admin.ModelAdmin):
         if not request.user.has_permission('admin_op'):
             self.message_user(request, "BAN解除には運営権限が必要です。", level='error')
             return
-        updated = queryset.update(is_approved_by_admin=False)
+        updated = queryset.update(is_approved_by_admin=False, updated_at=timezone.now())
+        invalidate_ban_index()
         self.message_user(request, f"{updated}件のIPアドレスのBANを解除する (投稿不可にする)")
     reject_ban_ip.short_description = "選択したIPのBANを解除する (投稿不可にする)"
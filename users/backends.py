@@ -0,0 +1,19 @@
+# users/backends.py
+from django.contrib.auth.backends import ModelBackend
+
+from .cache import cache_user, get_cached_user
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    セッションからのユーザー読み込みをワーカー内キャッシュ経由で行う ModelBackend。
+    キャッシュは CustomUser.save / delete のコミット後に無効化される。
+    """
+
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache_user(user)
+        return user
@@ -0,0 +1,46 @@
+# users/cache.py
+# ワーカープロセス毎の短期ユーザーキャッシュ。
+# 認証済みリクエスト毎の CustomUser 取得クエリを省くために使う (users.backends.CachedModelBackend)。
+# プロセス間では共有されないため、他ワーカーでの変更は最大 USER_CACHE_TTL 秒遅れて反映される。
+import copy
+import threading
+import time
+
+from django.conf import settings
+
+_users = {} # user_id -> (有効期限, CustomUser)
+_lock = threading.Lock() # gthread ワーカーなどで追加と追い出しが同時に走らないようにする
+
+
+def get_cached_user(user_id):
+    entry = _users.get(user_id)
+    if entry is None:
+        return None
+    expires_at, user = entry
+    if expires_at < time.monotonic():
+        _users.pop(user_id, None)
+        return None
+    # リクエスト内での属性変更が他のリクエストに漏れないよう、コピーを返す
+    return copy.copy(user)
+
+
+def cache_user(user):
+    ttl = settings.USER_CACHE_TTL
+    max_size = settings.USER_CACHE_MAX_SIZE
+    if ttl <= 0 or max_size <= 0:
+        return
+    entry = (time.monotonic() + ttl, copy.copy(user))
+    with _lock:
+        _users.pop(user.pk, None) # 入れ直して挿入順の末尾に移す
+        while len(_users) >= max_size:
+            # dict は挿入順なので、最も古いエントリから捨てる
+            _users.pop(next(iter(_users)), None)
+        _users[user.pk] = entry
+
+
+def invalidate_user(user_id):
+    _users.pop(user_id, None)
+
+
+def clear_user_cache():
+    _users.clear()
@@ -0,0 +1,18 @@
+# users/middleware.py
+from .network import is_ip_banned, resolve_client_ip
+
+
+class ClientIPMiddleware:
+    """
+    信頼できるプロキシを考慮してクライアントIPを解決し、request.client_ip (文字列または None) と
+    request.is_ip_banned (BAN中のアドレス / ネットワークに含まれるか) を設定する。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        ip = resolve_client_ip(request)
+        request.client_ip = str(ip) if ip is not None else None
+        request.is_ip_banned = ip is not None and is_ip_banned(ip)
+        return self.get_response(request)
@@ -2,10 +2,14 @@
 import os
 import hashlib
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models.signals import post_save
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .cache import invalidate_user
+from .network import invalidate_ban_index, min_ban_prefix, parse_ban_target
+
 class CustomUser(AbstractUser):
     PERMISSION_CHOICES = [
         ('blue_id', '青ID'),
@@ -31,32 +35,45 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # 管理画面のメールアドレス前方一致検索用 (PostgreSQL では LIKE 'x%' にインデックスを使えるようにする)
+            models.Index(fields=['email'], name='customuser_email_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    # 権限レベルの序列 (大きいほど強い)
+    PERMISSION_RANKS = {
+        'blue_id': 0,
+        'speaker': 1,
+        'manager': 2,
+        'moderator': 3,
+        'summit': 4,
+        'admin_op': 5,
+    }
+    # 権限レベル毎のID表示色
+    ID_COLOR_MAP = {
+        'blue_id': 'blue',
+        'speaker': 'darkorange',
+        'manager': 'red',
+        'moderator': 'purple',
+        'summit': 'darkcyan',
+        'admin_op': 'red',
+    }
+
     # 権限チェック用のヘルパーメソッド
     def has_permission(self, required_level):
-        level_map = {
-            'blue_id': 0,
-            'speaker': 1,
-            'manager': 2,
-            'moderator': 3,
-            'summit': 4,
-            'admin_op': 5,
-        }
-        user_level = level_map.get(self.permission_level, 0)
-        req_level = level_map.get(required_level, 0)
+        user_level = self.PERMISSION_RANKS.get(self.permission_level, 0)
+        req_level = self.PERMISSION_RANKS.get(required_level, 0)
         return user_level >= req_level
 
     # ユーザーが保存される際に、権限レベルに応じてid_colorを設定
     def save(self, *args, **kwargs):
-        color_map = {
-            'blue_id': 'blue',
-            'speaker': 'darkorange',
-            'manager': 'red',
-            'moderator': 'purple',
-            'summit': 'darkcyan',
-            'admin_op': 'red',
-        }
-        self.id_color = color_map.get(self.permission_level, 'blue')
+        self.id_color = self.ID_COLOR_MAP.get(self.permission_level, 'blue')
         super().save(*args, **kwargs)
+        # ワーカー内のユーザーキャッシュを破棄 (users/cache.py)。
+        # コミット前に破棄すると、他のスレッドが変更前の行を読み直して USER_CACHE_TTL の間キャッシュしてしまう
+        pk = self.pk
+        transaction.on_commit(lambda: invalidate_user(pk))
 
 # ユーザーが保存された後にdisplay_hashを生成するシグナル
 @receiver(post_save, sender=CustomUser)
@@ -68,24 +85,70 @@ def create_user_display_hash(sender, instance, created, **kwargs):
         instance.display_hash = hashlib.sha256(unique_string.encode()).hexdigest()[:7]
         instance.save(update_fields=['display_hash'])
 
+@receiver(post_delete, sender=CustomUser)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_user(pk))
+
 
 class BannedIP(models.Model):
     ip_address = models.GenericIPAddressField(
-        unique=True,
         verbose_name='BAN対象IPアドレス',
-        protocol='IPv4'
+        protocol='both',
+        unpack_ipv4=True,
+        help_text='ネットワーク単位でBANする場合はネットワークアドレス (例: 203.0.113.0, 2001:db8::)'
+    )
+    prefix_length = models.PositiveSmallIntegerField(
+        blank=True,
+        null=True,
+        verbose_name='プレフィックス長',
+        help_text='空欄なら単一アドレス。例: IPv4 の /24 なら 24、IPv6 の /64 なら 64'
     )
     is_approved_by_admin = models.BooleanField(
         default=False,
         verbose_name='運営承認済み (解除可否)' # FalseならBAN状態、Trueなら承認済みで解除可
     )
     banned_at = models.DateTimeField(auto_now_add=True, verbose_name='BAN日時')
+    # BAN照合インデックスの変更確認に使う (users/network.py)。update() では自動更新されないので明示的に設定する
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新日時')
     reason = models.TextField(blank=True, verbose_name='BAN理由')
 
     def __str__(self):
         status = "承認済み (投稿可能)" if self.is_approved_by_admin else "BAN中 (投稿不可)"
-        return f"{self.ip_address} ({status})"
+        return f"{self.network} ({status})"
+
+    @property
+    def network(self):
+        return f"{self.ip_address}/{self.prefix_length}" if self.prefix_length is not None else self.ip_address
+
+    def clean(self):
+        super().clean()
+        if self.ip_address and self.prefix_length is not None:
+            max_length = 32 if ':' not in self.ip_address else 128
+            if self.prefix_length > max_length:
+                raise ValidationError({'prefix_length': f"プレフィックス長は {max_length} 以下にしてください。"})
+            min_length = min_ban_prefix(4 if max_length == 32 else 6)
+            if self.prefix_length < min_length:
+                raise ValidationError({'prefix_length': f"プレフィックス長は {min_length} 以上にしてください。"})
+
+    # 保存時にアドレスとプレフィックス長を正規化する (例: 203.0.113.5/24 -> 203.0.113.0/24)
+    # BAN照合インデックスを壊さないよう、不正な値や範囲が広すぎるネットワークは保存しない
+    def save(self, *args, **kwargs):
+        target = parse_ban_target(self.network or '')
+        if target is None:
+            raise ValidationError(f"無効なBAN対象です: {self.network}")
+        self.ip_address, self.prefix_length = target
+        super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = 'BANされたIPアドレス'
         verbose_name_plural = 'BANされたIPアドレス'
+        constraints = [
+            models.UniqueConstraint(fields=['ip_address', 'prefix_length'], name='bannedip_unique_network'),
+        ]
+
+# BannedIP が変更されたら、このワーカーのBAN照合インデックスを作り直す (コミット後)
+@receiver(post_save, sender=BannedIP)
+@receiver(post_delete, sender=BannedIP)
+def invalidate_ban_index_on_change(sender, **kwargs):
+    invalidate_ban_index()
@@ -0,0 +1,213 @@
+# users/network.py
+# クライアントIPの解決と、BANされたIPアドレス / ネットワークの照合。
+# どちらも ClientIPMiddleware から全リクエストで呼ばれるため、DBには触れずに判定できるようにしている。
+import ipaddress
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+_trusted_proxies = None
+
+
+def _get_trusted_proxies():
+    global _trusted_proxies
+    if _trusted_proxies is None:
+        _trusted_proxies = tuple(
+            ipaddress.ip_network(cidr, strict=False) for cidr in settings.TRUSTED_PROXIES
+        )
+    return _trusted_proxies
+
+
+def parse_ip(value):
+    """'1.2.3.4', '1.2.3.4:8080', '[2001:db8::1]:443', '::ffff:1.2.3.4' などを ip_address に変換する。不正なら None。"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.startswith('['): # [IPv6]:port
+        value = value[1:value.find(']')] if ']' in value else value[1:]
+    elif value.count(':') == 1: # IPv4:port
+        value = value.split(':', 1)[0]
+    value = value.split('%', 1)[0] # IPv6 のゾーンIDは無視する
+    try:
+        ip = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    # IPv4射影アドレス (::ffff:a.b.c.d) は IPv4 として扱う
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        return ip.ipv4_mapped
+    return ip
+
+
+def _is_trusted(ip):
+    return any(ip in network for network in _get_trusted_proxies() if network.version == ip.version)
+
+
+def resolve_client_ip(request):
+    """
+    信頼できるプロキシ (settings.TRUSTED_PROXIES) を経由している場合のみ X-Forwarded-For を参照し、
+    右から順に信頼できないアドレスを探す。先頭のホップはクライアントが自由に偽装できるため鵜呑みにしない。
+    """
+    remote_ip = parse_ip(request.META.get('REMOTE_ADDR'))
+    if remote_ip is None or not _is_trusted(remote_ip):
+        return remote_ip
+
+    forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    client_ip = remote_ip
+    for hop in reversed(forwarded_for.split(',')):
+        hop_ip = parse_ip(hop)
+        if hop_ip is None:
+            break # 解釈できないホップより左は信用しない
+        client_ip = hop_ip
+        if not _is_trusted(hop_ip):
+            break
+    return client_ip
+
+
+def get_client_ip(request):
+    """クライアントIPを文字列で返す。取得できない場合は None。"""
+    ip = getattr(request, 'client_ip', None) # ClientIPMiddleware で解決済みならそれを使う
+    if ip is None:
+        resolved = resolve_client_ip(request)
+        ip = str(resolved) if resolved is not None else None
+    return ip
+
+
+def min_ban_prefix(version):
+    return settings.BAN_MIN_PREFIX_V4 if version == 4 else settings.BAN_MIN_PREFIX_V6
+
+
+def parse_ban_target(value):
+    """
+    '203.0.113.5', '203.0.113.0/24', '2001:db8::/64' を (ネットワークアドレス, プレフィックス長) に変換する。
+    不正な値や、プレフィックス長が BAN_MIN_PREFIX_V4 / BAN_MIN_PREFIX_V6 より短い (範囲が広すぎる) 場合は None。
+    """
+    try:
+        if '/' in value:
+            network = ipaddress.ip_network(value.strip(), strict=False)
+        else:
+            ip = parse_ip(value)
+            if ip is None:
+                return None
+            network = ipaddress.ip_network(ip)
+    except ValueError:
+        return None
+    if network.prefixlen < min_ban_prefix(network.version):
+        return None
+    return str(network.network_address), network.prefixlen
+
+
+class BanIndex:
+    """
+    BAN中 (運営未承認) のアドレス / ネットワークを、IPバージョンとプレフィックス長毎の
+    整数集合にまとめたもの。照合はプレフィックス長の種類数だけの集合検索で済む。
+    不正な行やプレフィックス長が短すぎる行は、1行のために全リクエストが失敗しないよう警告を出して読み飛ばす。
+    """
+
+    def __init__(self, bans):
+        tables = {4: {}, 6: {}}
+        for ip_address, prefix_length in bans:
+            try:
+                if prefix_length is None: # 単一アドレス
+                    network = ipaddress.ip_network(ip_address)
+                else:
+                    network = ipaddress.ip_network(f"{ip_address}/{prefix_length}", strict=False)
+            except ValueError:
+                logger.warning("不正なBAN対象を無視しました: %s/%s", ip_address, prefix_length)
+                continue
+            if network.prefixlen < min_ban_prefix(network.version):
+                logger.warning("範囲が広すぎるBAN対象を無視しました: %s", network)
+                continue
+            tables[network.version].setdefault(network.prefixlen, set()).add(int(network.network_address))
+        self._tables = {
+            version: tuple(
+                (self._mask(version, prefix_length), frozenset(networks))
+                for prefix_length, networks in sorted(by_prefix.items(), reverse=True)
+            )
+            for version, by_prefix in tables.items()
+        }
+
+    @staticmethod
+    def _mask(version, prefix_length):
+        bits = 32 if version == 4 else 128
+        return ((1 << prefix_length) - 1) << (bits - prefix_length)
+
+    def __contains__(self, ip):
+        if isinstance(ip, str):
+            ip = parse_ip(ip)
+        if ip is None:
+            return False
+        value = int(ip)
+        return any(value & mask in networks for mask, networks in self._tables[ip.version])
+
+
+class _BanIndexCache:
+    """
+    ワーカー毎に BanIndex を保持する。BAN_INDEX_TTL 秒毎 (または BannedIP の変更時) に件数と最終更新日時だけを確認し、
+    変わっていた場合のみ作り直す。確認・作り直しの間、他のスレッドは待たずに古いインデックスで判定する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._expires_at = 0.0
+
+    def get(self):
+        index = self._index
+        if index is not None and self._expires_at >= time.monotonic():
+            return index
+        # 初回は作り終わるまで待つ。それ以外は他のスレッドが確認中なら古いインデックスを使う
+        if not self._lock.acquire(blocking=index is None):
+            return index
+        try:
+            if self._index is None or self._expires_at < time.monotonic():
+                version = self._current_version()
+                if self._index is None or version != self._version:
+                    self._index = self._build()
+                    self._version = version
+                self._expires_at = time.monotonic() + settings.BAN_INDEX_TTL
+            return self._index
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        # 次の判定で変更の有無を確認させる (変わっていれば作り直す)
+        self._expires_at = 0.0
+
+    @cached_property
+    def _model(self):
+        from .models import BannedIP # models からこのモジュールを import するため遅延させる
+        return BannedIP
+
+    def _current_version(self):
+        # BAN中の件数と全体の最終更新日時。承認・解除 (update) では updated_at も更新すること
+        return self._model.objects.aggregate(
+            count=Count('pk', filter=Q(is_approved_by_admin=False)),
+            updated_at=Max('updated_at'),
+        )
+
+    def _build(self):
+        bans = self._model.objects.filter(is_approved_by_admin=False).values_list('ip_address', 'prefix_length')
+        return BanIndex(bans.iterator())
+
+
+_ban_index = _BanIndexCache()
+
+
+def is_ip_banned(ip):
+    return ip in _ban_index.get()
+
+
+def invalidate_ban_index():
+    """
+    このワーカーの BanIndex を次の判定で確認させる。queryset.update() で BannedIP を変更した後に呼ぶこと。
+    トランザクション中はコミット後に確認させる (コミット前に確認すると変更前の状態が TTL の間残るため)。
+    """
+    transaction.on_commit(_ban_index.invalidate)